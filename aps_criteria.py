@@ -1,32 +1,105 @@
+import hashlib
+import json
+import os
 from collections import namedtuple
+from types import MappingProxyType
 
 Criterion = namedtuple('Criterion', ['key', 'domain', 'descriptor', 'points'])
 
-criteria = {
-    '16_week_fetal_death': Criterion(key='16_week_fetal_death', domain=4, descriptor='Fetal death (16w – 33w 6d) in the absence of pre-eclampsia with severe features or placental insufficiency with severe features (**1 point**)', points=1),
-    '3_consecutive_losses': Criterion(key='3_consecutive_losses', domain=4, descriptor='3 or more consecutive pre-fetal (<10w) and/or early fetal (10w -15w 6d) deaths (**1 point**)', points=1),
-    'adrenal_hemorrhage_path': Criterion(key='adrenal_hemorrhage_path', domain=3, descriptor='Adrenal hemorrhage (imaging or pathology)', points=5),
-    'apl_nephropathy_exam': Criterion(key='apl_nephropathy_exam', domain=3, descriptor='Acute/chronic aPL-nephropathy (exam or lab)', points=2),
-    'apl_nephropathy_path': Criterion(key='apl_nephropathy_path', domain=3, descriptor='Acute/chronic aPL-nephropathy (pathology)', points=5),
-    'ate_high_risk': Criterion(key='ate_high_risk', domain=2, descriptor='ATE with a high risk CVD profile (**2 points**)', points=2),
-    'ate_low_risk': Criterion(key='ate_low_risk', domain=2, descriptor='ATE without a high risk CVD profile (**4 points**)', points=4),
-    'high_pos_igg_and': Criterion(key='high_pos_igg_and', domain=8, descriptor='High positive IgG (aCL _AND_ aβ2GPI) (**7 points**)', points=7),
-    'high_pos_igg_or': Criterion(key='high_pos_igg_or', domain=8, descriptor='High positive IgG (aCL _OR_ aβ2GPI) (**5 points**)', points=5),
-    'livedo_racemosa': Criterion(key='livedo_racemosa', domain=3, descriptor='Livedo racemosa (exam)', points=2),
-    'livedo_vasculopathy_exam': Criterion(key='livedo_vasculopathy_exam', domain=3, descriptor='Livedoid vasculopathy lesions (exam)', points=2),
-    'livedo_vasculopathy_path': Criterion(key='livedo_vasculopathy_path', domain=3, descriptor='Livedoid vasculopathy (pathology)', points=5),
-    'mod_high_igm': Criterion(key='mod_high_igm', domain=8, descriptor='Moderate or high positive IgM (aCL and/or aβ2GPI) (**1 point**)', points=1),
-    'mod_pos_igg': Criterion(key='mod_pos_igg', domain=8, descriptor='Moderate positive IgG (aCL and/or aβ2GPI) (**4 points**)', points=4),
-    'myocardial_path': Criterion(key='myocardial_path', domain=3, descriptor='Myocardial disease (imaging or pathology)', points=5),
-    'persistent_lac': Criterion(key='persistent_lac', domain=7, descriptor='Positive LAC (persistent) (**5 points**)', points=5),
-    'pre_eclampsia_and_pi': Criterion(key='pre_eclampsia_and_pi', domain=4, descriptor='Pre-eclampsia with severe features (<34w) _AND_ placental insufficiency with severe features (<34w with/without fetal death (**4 points**)', points=4),
-    'pre_eclampsia_or_pi': Criterion(key='pre_eclampsia_or_pi', domain=4, descriptor='Pre-eclampsia with severe features (<34w) _OR_ placental insufficiency with severe features (<34w with/without fetal death (**3 points**)', points=3),
-    'pulm_hemorrhage_path': Criterion(key='pulm_hemorrhage_path', domain=3, descriptor='Pulmonary hemorrhage (BAL or pathology)', points=5),
-    'pulm_hemorrhage_symptoms': Criterion(key='pulm_hemorrhage_symptoms', domain=3, descriptor='Pulmonary hemorrhage (symptoms and imaging)', points=2),
-    'single_lac': Criterion(key='single_lac', domain=7, descriptor='Positive LAC (single – one time) (**1 point**)', points=1),
-    'thrombocytopenia': Criterion(key='thrombocytopenia', domain=6, descriptor='Thrombocytopenia (lowest 20-130 x109/L) (**2 points**)', points=2),
-    'valve_thickening': Criterion(key='valve_thickening', domain=5, descriptor='Thickening (**2 points**)', points=2),
-    'valve_vegetation': Criterion(key='valve_vegetation', domain=5, descriptor='Vegetation (**4 points**)', points=4),
-    'vte_high_risk': Criterion(key='vte_high_risk', domain=1, descriptor='VTE with a high risk profile (**1 point**)', points=1),
-    'vte_low_risk': Criterion(key='vte_low_risk', domain=1, descriptor='VTE without a high risk profile (**3 points**)', points=3)
-}
\ No newline at end of file
+# Criteria sets are declared in criteria_sets/<version>.json; the app and the batch paths use DEFAULT_CRITERIA_SET
+CRITERIA_SETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'criteria_sets')
+DEFAULT_CRITERIA_SET = 'aps_2023'
+
+# Compiled, read-only view of the criteria built once at import; lets callers avoid scanning criteria.values()
+# keys: every criterion key, grouped by domain and ordered by points within a domain; a key's index is its bit position
+# bit_position: {key: bit}, so a patient's answers can be encoded as a single integer bitmask
+# by_domain: {domain: tuple of Criterion ordered by points}
+# domain_shift, domain_width: the domain's criteria occupy bits shift ... shift + width - 1 of the bitmask
+# domain_points: {domain: tuple of points, ordered as in by_domain}
+CriteriaRegistry = namedtuple('CriteriaRegistry', ['keys', 'bit_position', 'by_domain', 'domain_shift',
+                                                   'domain_width', 'domain_points'])
+
+
+def compile_registry(criteria_by_key: dict):
+    ordered = sorted(criteria_by_key.values(), key=lambda criterion: (criterion.domain, criterion.points))
+    domains = sorted({criterion.domain for criterion in ordered})
+    by_domain = {domain: tuple(c for c in ordered if c.domain == domain) for domain in domains}
+    keys = tuple(criterion.key for criterion in ordered)
+
+    return CriteriaRegistry(
+        keys=keys,
+        bit_position=MappingProxyType({key: bit for bit, key in enumerate(keys)}),
+        by_domain=MappingProxyType(by_domain),
+        domain_shift=MappingProxyType({domain: keys.index(by_domain[domain][0].key) for domain in domains}),
+        domain_width=MappingProxyType({domain: len(by_domain[domain]) for domain in domains}),
+        domain_points=MappingProxyType({domain: tuple(c.points for c in by_domain[domain]) for domain in domains}))
+
+
+# A criteria set loaded from its declarative file
+# version: file name without .json, e.g. aps_2023; sha256: hash of the file contents
+# criteria: {key: Criterion}; domain_names: {domain: name}
+# clinical_domains, lab_domains: domain numbers; every clinical domain is numbered below every laboratory domain
+# clinical_threshold, lab_threshold: minimum clinical and laboratory totals for classification
+# entry_clinical, entry_lab: {entry criterion key: descriptor}, empty if the set has no entry criteria
+CriteriaSet = namedtuple('CriteriaSet', ['name', 'version', 'sha256', 'criteria', 'domain_names', 'clinical_domains',
+                                         'lab_domains', 'clinical_threshold', 'lab_threshold', 'entry_clinical',
+                                         'entry_lab', 'registry'])
+
+
+def criteria_set_path(version: str):
+    """Path of a criteria set given its version (e.g. 'sapporo_2006') or a path to a .json file"""
+    return version if version.endswith('.json') else os.path.join(CRITERIA_SETS_DIR, f'{version}.json')
+
+
+def load_criteria_set(version: str = DEFAULT_CRITERIA_SET):
+    """Loads and validates a criteria set file (see criteria_set_path); raises ValueError if it is inconsistent"""
+    path = criteria_set_path(version)
+    with open(path, 'rb') as f:
+        contents = f.read()
+    spec = json.loads(contents)
+
+    domain_names = {domain['domain']: domain['name'] for domain in spec['domains']}
+    clinical = tuple(sorted(d['domain'] for d in spec['domains'] if d['type'] == 'clinical'))
+    lab = tuple(sorted(d['domain'] for d in spec['domains'] if d['type'] == 'laboratory'))
+    criteria_by_key = {c['key']: Criterion(c['key'], c['domain'], c['descriptor'], c['points'])
+                       for c in spec['criteria']}
+
+    if len(domain_names) != len(spec['domains']) or len(clinical) + len(lab) != len(domain_names):
+        raise ValueError(f'{path}: domains must be unique and of type clinical or laboratory')
+    if clinical and lab and max(clinical) > min(lab):
+        raise ValueError(f'{path}: clinical domains must be numbered below laboratory domains')
+    if len(criteria_by_key) != len(spec['criteria']):
+        raise ValueError(f'{path}: criterion keys must be unique')
+    if {c.domain for c in criteria_by_key.values()} != set(domain_names):
+        raise ValueError(f'{path}: every criterion needs a declared domain and every domain at least one criterion')
+
+    return CriteriaSet(name=spec['name'], version=os.path.splitext(os.path.basename(path))[0],
+                       sha256=hashlib.sha256(contents).hexdigest(), criteria=MappingProxyType(criteria_by_key),
+                       domain_names=MappingProxyType(domain_names), clinical_domains=clinical, lab_domains=lab,
+                       clinical_threshold=spec['thresholds']['clinical'],
+                       lab_threshold=spec['thresholds']['laboratory'],
+                       entry_clinical=MappingProxyType({e['key']: e['descriptor'] for e in spec['entry']['clinical']}),
+                       entry_lab=MappingProxyType({e['key']: e['descriptor'] for e in spec['entry']['laboratory']}),
+                       registry=compile_registry(criteria_by_key))
+
+
+criteria_set = load_criteria_set()
+criteria = dict(criteria_set.criteria)
+registry = criteria_set.registry
+
+ENTRY_CLINICAL_CRITERIA = list(criteria_set.entry_clinical.values())
+ENTRY_LAB_CRITERIA = list(criteria_set.entry_lab.values())
+
+# Widget keys of the entry criteria checkboxes, also used as column/field names by the batch paths
+ENTRY_CLINICAL_KEYS = tuple(criteria_set.entry_clinical)
+ENTRY_LAB_KEYS = tuple(criteria_set.entry_lab)
+ENTRY_KEYS = ENTRY_CLINICAL_KEYS + ENTRY_LAB_KEYS  # a key's index is its bit position in an entry bitmask
+
+
+def encode_answers(answers: dict):
+    """Encodes {criterion key: checked} (e.g. session_state.cache) as an integer bitmask using registry.bit_position"""
+    mask = 0
+    for key, checked in answers.items():
+        if checked:
+            mask |= 1 << registry.bit_position[key]
+    return mask
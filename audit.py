@@ -0,0 +1,189 @@
+"""
+Audit log of completed assessments, persisted to a local SQLite database without blocking page renders.
+
+The web app enqueues one record per completed assessment; a background writer thread drains the queue and inserts
+records in batched transactions. The queue is bounded, so if the disk falls behind, callers block (backpressure)
+instead of memory growing without limit. Queued records are flushed when the log is closed, including at exit.
+
+The database path comes from APS_AUDIT_DB (default aps_audit.sqlite3 in the working directory; set it to an empty
+string to turn auditing off; the benchmark and load harnesses do). Reporting queries run on their own read-only
+connection:
+    python audit.py aps_audit.sqlite3        counts by date and by classification
+"""
+
+import argparse
+import atexit
+import datetime
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import namedtuple
+
+from scoring import DOMAINS
+
+DEFAULT_PATH = 'aps_audit.sqlite3'
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS assessments (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,      -- Unix time
+    recorded_date TEXT NOT NULL,    -- UTC date, YYYY-MM-DD
+    entry INTEGER NOT NULL,         -- entry criteria bitmask (bit positions from aps_criteria.ENTRY_KEYS)
+    answers INTEGER NOT NULL,       -- additive criteria bitmask (bit positions from aps_criteria.registry)
+    {', '.join(f'd{domain} INTEGER NOT NULL' for domain in DOMAINS)},
+    clinical INTEGER NOT NULL,
+    lab INTEGER NOT NULL,
+    meets_entry INTEGER NOT NULL,
+    classified INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS assessments_date ON assessments (recorded_date, classified);
+CREATE INDEX IF NOT EXISTS assessments_classified ON assessments (classified);
+"""
+
+COLUMNS = ('recorded_at', 'recorded_date', 'entry', 'answers') + tuple(f'd{domain}' for domain in DOMAINS) + \
+    ('clinical', 'lab', 'meets_entry', 'classified')
+INSERT = f'INSERT INTO assessments ({", ".join(COLUMNS)}) VALUES ({", ".join("?" * len(COLUMNS))})'
+
+AuditRecord = namedtuple('AuditRecord', ['recorded_at', 'entry', 'answers', 'assessment'])
+
+
+def _row(record: AuditRecord):
+    assessment = record.assessment
+    date = datetime.datetime.fromtimestamp(record.recorded_at, datetime.timezone.utc).date().isoformat()
+    return (record.recorded_at, date, record.entry, record.answers, *(assessment.scores[d] for d in DOMAINS),
+            assessment.clinical, assessment.lab, int(assessment.meets_entry), int(assessment.classified))
+
+
+def connect(path: str):
+    """Opens the audit database, creating the table and indexes if needed"""
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')  # readers (reporting queries) do not block the writer
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class AuditLog:
+    """Bounded queue of AuditRecords drained into SQLite by a daemon writer thread"""
+
+    def __init__(self, path: str, max_queue: int = 10_000, batch_size: int = 500, flush_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._connection = connect(path)
+        self._closed = False
+        # Held while checking _closed and enqueueing, so that no record is queued behind the shutdown sentinel
+        self._closing = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name='aps-audit-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, entry: int, answers: int, assessment, timeout: float = None):
+        """Enqueues one completed assessment (a scoring.Assessment). Blocks while the queue is full, raising
+        queue.Full after timeout seconds if given"""
+        with self._closing:
+            if self._closed:
+                raise RuntimeError('Audit log is closed')
+            self._queue.put(AuditRecord(time.time(), entry, answers, assessment), timeout=timeout)
+
+    def flush(self):
+        """Blocks until every record enqueued so far is committed"""
+        self._queue.join()
+
+    def close(self):
+        """Commits the remaining records and stops the writer; safe to call more than once"""
+        with self._closing:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._writer.join()
+        self._connection.close()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Collect whatever else arrives within flush_interval, up to batch_size, into the same transaction
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            records = [record for record in batch if record is not None]
+            try:
+                if records:
+                    with self._connection:
+                        self._connection.executemany(INSERT, map(_row, records))
+            except sqlite3.Error:
+                # Keep draining the queue so that the app never blocks on a broken database
+                logging.getLogger(__name__).exception('Could not write %d audit record(s) to %s', len(records),
+                                                      self.path)
+            for _ in batch:
+                self._queue.task_done()
+            if batch[-1] is None:
+                return
+
+
+def counts_by_date(path: str, start: str = None, end: str = None):
+    """[(date, assessments, classified)] per UTC date (YYYY-MM-DD), optionally limited to start <= date <= end"""
+    query = 'SELECT recorded_date, COUNT(*), SUM(classified) FROM assessments'
+    conditions, parameters = [], []
+    if start:
+        conditions.append('recorded_date >= ?')
+        parameters.append(start)
+    if end:
+        conditions.append('recorded_date <= ?')
+        parameters.append(end)
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    return _query(path, query + ' GROUP BY recorded_date ORDER BY recorded_date', parameters)
+
+
+def counts_by_classification(path: str):
+    """{True: classified assessments, False: not classified}"""
+    counts = dict(_query(path, 'SELECT classified, COUNT(*) FROM assessments GROUP BY classified'))
+    return {True: counts.get(1, 0), False: counts.get(0, 0)}
+
+
+def _query(path: str, query: str, parameters=()):
+    # Read-only, so that a mistyped path raises sqlite3.OperationalError instead of creating an empty database
+    connection = sqlite3.connect(f'file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro', uri=True)
+    try:
+        return connection.execute(query, parameters).fetchall()
+    finally:
+        connection.close()
+
+
+def open_from_environment(environ=os.environ):
+    """The app's AuditLog at APS_AUDIT_DB, or None if auditing is turned off"""
+    path = environ.get('APS_AUDIT_DB', DEFAULT_PATH)
+    return AuditLog(path) if path else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report on the audit log of completed assessments')
+    parser.add_argument('database', nargs='?', default=DEFAULT_PATH, help='Audit database (SQLite)')
+    parser.add_argument('--start', help='First date to report (YYYY-MM-DD)')
+    parser.add_argument('--end', help='Last date to report (YYYY-MM-DD)')
+    args = parser.parse_args(argv)
+
+    try:
+        by_date = counts_by_date(args.database, args.start, args.end)
+        counts = counts_by_classification(args.database)
+    except sqlite3.Error as e:
+        parser.exit(1, f'error: {args.database}: {e}\n')
+
+    print(f'{"date":<12} {"assessments":>12} {"classified":>12}')
+    for date, total, classified in by_date:
+        print(f'{date:<12} {total:>12} {classified:>12}')
+    print(f'classified {counts[True]}, not classified {counts[False]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+Benchmark suite for scoring and page rendering.
+
+    micro   calculate_scores() and meets_entry_criteria() from main.py, per call; calculate_scores with the result
+            cache cleared before every call (scoring and rendering one report) and, as calculate_scores_cached, served
+            from the cache
+    batch   score_matrix and lookup-table scoring (encode_matrix + score_masks) on 10^3 ... 10^7 synthetic patients
+    render  headless render time of each of the ten pages via Streamlit's AppTest harness
+    import  cold start of a fresh interpreter importing each Streamlit-free core module, as a pool worker would
+
+Results are written as JSON (median/min seconds per benchmark). With --compare, results are checked against a stored
+baseline and the exit code is 1 if any benchmark is slower than the baseline by more than --threshold. The import
+suite also exits 1 if a core module takes longer than --import-budget to import or pulls in Streamlit (or any other
+module outside the standard library and NumPy).
+
+Usage: python benchmark.py --output results.json [--compare baseline.json --threshold 0.1] [--suites micro,batch]
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+import numpy as np
+
+from aps_criteria import ENTRY_CLINICAL_KEYS, ENTRY_KEYS, ENTRY_LAB_KEYS, encode_answers
+from scoring import CRITERIA_KEYS, encode_matrix, score_masks, score_matrix
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+PAGES = ['show_entry_criteria_page', 'show_vte_page', 'show_ate_page', 'show_microvascular_page',
+         'show_obstetric_page', 'show_cardiac_page', 'show_hematology_page', 'show_lac_page', 'show_apl_page',
+         'show_score']
+SUITES = ('micro', 'batch', 'render', 'import')
+# Modules batch workers and the service import; none may depend on anything beyond the standard library and NumPy
+CORE_MODULES = ('aps_criteria', 'scoring', 'evaluators', 'derive', 'longitudinal', 'classify_cohort', 'result_cache',
+                'export_reports', 'cohort_store', 'service')
+THIRD_PARTY_ALLOWED = {'numpy'}
+IMPORT_BUDGET_S = 0.5  # default --import-budget
+
+# Run in a fresh interpreter from the repo directory: prints the import time and the top-level packages the import
+# loaded that are neither in the standard library nor modules of this repo
+IMPORT_PROBE = """
+import os, sys, time
+before = set(sys.modules)
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = {{name.partition('.')[0] for name in set(sys.modules) - before if not name.startswith('__')}}
+local = {{name for name in loaded
+         if os.path.dirname(getattr(sys.modules[name], '__file__', None) or '') == os.getcwd()}}
+print(elapsed, *sorted(loaded - set(sys.stdlib_module_names) - local))
+"""
+
+# A typical completed assessment: entry criteria met, a few additive criteria checked
+SAMPLE_ANSWERS = encode_answers({'vte_low_risk': True, 'persistent_lac': True, 'mod_pos_igg': True})
+SAMPLE_ENTRY = 1 << ENTRY_KEYS.index(ENTRY_CLINICAL_KEYS[0]) | 1 << ENTRY_KEYS.index(ENTRY_LAB_KEYS[0])
+
+
+def measure(function, repeat: int = 5):
+    """Times function with timeit's autorange; returns {median_s, min_s} per call over repeat rounds"""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    per_call = [total / number for total in timer.repeat(repeat=repeat, number=number)]
+    return {'median_s': statistics.median(per_call), 'min_s': min(per_call), 'calls': number * repeat}
+
+
+def run_micro():
+    # Imported here so that the other suites do not need Streamlit; main.py works in Streamlit's bare mode
+    import streamlit as st
+    import main
+    from result_cache import result_cache
+
+    st.session_state['answers'] = SAMPLE_ANSWERS
+    st.session_state['entry'] = SAMPLE_ENTRY
+
+    def uncached():
+        result_cache.clear()
+        return main.calculate_scores()
+
+    return {'micro/calculate_scores': measure(uncached),
+            'micro/calculate_scores_cached': measure(main.calculate_scores),
+            'micro/meets_entry_criteria': measure(main.meets_entry_criteria)}
+
+
+def run_batch(max_exponent: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    results = {}
+    for exponent in range(3, max_exponent + 1):
+        n = 10 ** exponent
+        matrix = rng.random((n, len(CRITERIA_KEYS)), dtype=np.float32) < 0.1
+        repeat = 5 if n <= 10 ** 5 else 3
+
+        for name, function in [('score_matrix', lambda: score_matrix(matrix)),
+                               ('lookup_table', lambda: score_masks(encode_matrix(matrix)))]:
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                function()
+                samples.append(time.perf_counter() - start)
+            median = statistics.median(samples)
+            results[f'batch/{name}/1e{exponent}'] = {'median_s': median, 'min_s': min(samples), 'patients': n,
+                                                      'patients_per_s': n / median}
+        del matrix
+    return results
+
+
+def run_render(repeat: int = 20):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ['APS_AUDIT_DB'] = ''  # Benchmark runs of the score page must not be recorded in the audit log
+    results = {}
+    for page, name in enumerate(PAGES):
+        app = AppTest.from_file(MAIN_SCRIPT, default_timeout=30)
+        app.session_state['page'] = page
+        app.session_state['answers'] = SAMPLE_ANSWERS
+        app.session_state['entry'] = SAMPLE_ENTRY
+        app.run()  # warm-up: first run compiles the script and imports modules
+        if app.exception:
+            raise RuntimeError(f'{name} raised: {app.exception[0].value}')
+
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            app.run()
+            samples.append(time.perf_counter() - start)
+        results[f'render/{name}'] = {'median_s': statistics.median(samples), 'min_s': min(samples)}
+    return results
+
+
+def probe_import(module: str):
+    """Imports module in a fresh interpreter; returns the import time in seconds and the set of top-level packages
+    it loaded from outside the standard library and this repo"""
+    output = subprocess.run([sys.executable, '-c', IMPORT_PROBE.format(module=module)],
+                            cwd=os.path.dirname(MAIN_SCRIPT), check=True, capture_output=True, text=True).stdout.split()
+    return float(output[0]), set(output[1:])
+
+
+def run_import(repeat: int = 5):
+    """Imports each core module in repeat fresh interpreters; returns timings and the disallowed modules loaded"""
+    results, violations = {}, {}
+    for module in CORE_MODULES:
+        samples, startups = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            elapsed, loaded = probe_import(module)
+            startups.append(time.perf_counter() - start)
+            samples.append(elapsed)
+        results[f'import/{module}'] = {'median_s': statistics.median(samples), 'min_s': min(samples),
+                                       'process_start_s': statistics.median(startups)}
+        if loaded - THIRD_PARTY_ALLOWED:
+            violations[module] = sorted(loaded - THIRD_PARTY_ALLOWED)
+    return results, violations
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Prints current vs baseline medians; returns the names of benchmarks slower by more than threshold"""
+    regressions = []
+    print(f'{"benchmark":<44} {"baseline":>12} {"current":>12} {"change":>8}')
+    for name, result in results.items():
+        if name not in baseline:
+            print(f'{name:<44} {"-":>12} {result["median_s"]:>12.3g} {"new":>8}')
+            continue
+        change = result['median_s'] / baseline[name]['median_s'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:<44} {baseline[name]["median_s"]:>12.3g} {result["median_s"]:>12.3g} {change:>+8.1%}{flag}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark scoring and page rendering')
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to write results (JSON)')
+    parser.add_argument('--compare', help='Baseline results file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown of the median counted as a regression (default 0.10)')
+    parser.add_argument('--suites', default=','.join(SUITES), help=f'Comma-separated subset of {", ".join(SUITES)}')
+    parser.add_argument('--max-exponent', type=int, default=7, help='Largest batch size is 10^max-exponent patients')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET_S,
+                        help=f'Longest acceptable import of a core module in a fresh interpreter, seconds '
+                             f'(default {IMPORT_BUDGET_S})')
+    args = parser.parse_args(argv)
+
+    suites = args.suites.split(',')
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f'Unknown suite(s): {", ".join(sorted(unknown))}')
+
+    logging.disable(logging.WARNING)  # Streamlit's bare-mode warnings would flood the output and skew micro timings
+    results = {}
+    if 'micro' in suites:
+        results.update(run_micro())
+    if 'batch' in suites:
+        results.update(run_batch(args.max_exponent))
+    if 'render' in suites:
+        results.update(run_render())
+    over_budget = []
+    if 'import' in suites:
+        import_results, violations = run_import()
+        results.update(import_results)
+        for module, loaded in violations.items():
+            over_budget.append(f'{module} imports {", ".join(loaded)}')
+        over_budget += [f'{name} took {result["median_s"]:.3f}s' for name, result in import_results.items()
+                        if result['median_s'] > args.import_budget]
+
+    report = {'meta': {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                       'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+                       'cpu_count': os.cpu_count()},
+              'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for problem in over_budget:
+        print(f'IMPORT BUDGET: {problem}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) over {args.threshold:.0%}: {", ".join(regressions)}')
+            sys.exit(1)
+    else:
+        for name, result in results.items():
+            print(f'{name:<44} {result["median_s"]:>12.3g} s')
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+"""
+Command-line batch classification of a patient cohort against the 2023 ACR/EULAR APS classification criteria.
+
+The input file (CSV or Parquet) has one column per criterion key (e.g. vte_low_risk, persistent_lac, high_pos_igg_and)
+and one column per entry criterion flag (entry_clinical_0 ... entry_clinical_5, entry_lab_0 ... entry_lab_2), matching
+the widget keys used by the web app. It is streamed in fixed-size chunks, each chunk is scored in a worker process and
+results are appended to the output file in input order, so memory stays bounded regardless of cohort size.
+
+With --criteria, the cohort is instead scored against each given criteria set (a version in criteria_sets/, e.g.
+aps_2023 or sapporo_2006, or a path to a criteria set file) in one pass. The input then needs a column for every
+criterion and entry criterion of every set, and each set's result columns are prefixed with its version, e.g.
+sapporo_2006_classified.
+
+Usage: python classify_cohort.py registry.csv results.csv --workers 8 --chunk-size 100000
+       python classify_cohort.py registry.csv results.csv --criteria aps_2023 --criteria sapporo_2006
+"""
+
+import argparse
+import collections
+import csv
+import functools
+import io
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+from aps_criteria import ENTRY_KEYS
+from evaluators import combine_evaluators, load_evaluator, score_versions
+from scoring import CRITERIA_KEYS, DOMAINS, encode_entry_matrix, meets_entry_masks, score_matrix
+
+INPUT_COLUMNS = ENTRY_KEYS + CRITERIA_KEYS
+TOTAL_COLUMNS = ('clinical', 'lab', 'meets_entry', 'classified')
+RESULT_COLUMNS = tuple(f'D{domain}' for domain in DOMAINS) + TOTAL_COLUMNS
+
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y')
+FALSE_VALUES = ('0', 'false', 'f', 'no', 'n', '')
+# None is a null cell (e.g. from a nullable Parquet column), unchecked like a blank CSV cell
+_FLAG_VALUES = {None: False, **dict.fromkeys(FALSE_VALUES, False), **dict.fromkeys(TRUE_VALUES, True)}
+
+# Lines csv.reader parses to an empty row; they are skipped rather than counted as patients
+BLANK_LINES = ('\n', '\r\n', '\r')
+
+# A block of raw CSV lines from read_csv_chunks: columns are the input columns to parse, first_line is the line number
+# of its first line in the file (for error messages) and rows the number of non-blank lines in it
+CsvBlock = collections.namedtuple('CsvBlock', ['text', 'header', 'columns', 'id_column', 'first_line', 'rows'])
+
+
+def _parse_flag(value: str):
+    try:
+        return _FLAG_VALUES[value]
+    except KeyError:
+        normalized = value.strip().lower()
+        if normalized not in _FLAG_VALUES:
+            raise ValueError(f'unrecognized flag value {value!r}') from None
+        return _FLAG_VALUES[normalized]
+
+
+def parse_flags(column, name: str):
+    """Converts a column of flags to booleans. Strings may be 1/0, true/false or yes/no in any case (blank or null =
+    unchecked); numeric columns are checked when non-zero (NaN = unchecked)"""
+    if isinstance(column, np.ndarray) and column.dtype.kind in 'biuf':
+        return (column != 0) & ~np.isnan(column) if column.dtype.kind == 'f' else column != 0
+    try:
+        return np.fromiter(map(_FLAG_VALUES.__getitem__, column), dtype=bool, count=len(column))
+    except KeyError:
+        pass  # Fall back to normalizing each value, e.g. ' TRUE' or 'Yes'
+    try:
+        return np.fromiter(map(_parse_flag, column), dtype=bool, count=len(column))
+    except ValueError as e:
+        raise ValueError(f'Column {name!r} has {e}') from None
+
+
+def classify_chunk(chunk: dict):
+    """Scores one chunk ({column name: array}) and returns {result column: array}, plus the id column if present"""
+    entry_flags = np.column_stack([parse_flags(chunk[name], name) for name in ENTRY_KEYS])
+    answers = np.column_stack([parse_flags(chunk[key], key) for key in CRITERIA_KEYS])
+
+    scores = score_matrix(answers)
+    meets_entry = meets_entry_masks(encode_entry_matrix(entry_flags))
+
+    results = {f'D{domain}': scores.domains[:, i] for i, domain in enumerate(DOMAINS)}
+    results['clinical'] = scores.clinical
+    results['lab'] = scores.lab
+    results['meets_entry'] = meets_entry
+    results['classified'] = meets_entry & scores.classified
+    if 'id' in chunk:
+        results = {'id': chunk['id'], **results}
+    return results
+
+
+def version_result_columns(combined):
+    """Result columns of classify_versions_chunk: the RESULT_COLUMNS of each criteria set, prefixed with its version"""
+    return tuple(f'{evaluator.version}_{name}' for evaluator in combined.evaluators
+                 for name in tuple(f'D{domain}' for domain in evaluator.domains) + TOTAL_COLUMNS)
+
+
+def classify_versions_chunk(chunk: dict, combined):
+    """Scores one chunk against every criteria set of an evaluators.CombinedEvaluator; returns {result column:
+    array} with the columns of version_result_columns, plus the id column if present"""
+    matrix = np.column_stack([parse_flags(chunk[key], key) for key in combined.keys])
+    results = {'id': chunk['id']} if 'id' in chunk else {}
+    for evaluator, scores in zip(combined.evaluators, score_versions(matrix, combined).values()):
+        prefix = f'{evaluator.version}_'
+        results.update({f'{prefix}D{domain}': scores.domains[:, i] for i, domain in enumerate(evaluator.domains)})
+        results.update({prefix + 'clinical': scores.clinical, prefix + 'lab': scores.lab,
+                        prefix + 'meets_entry': scores.meets_entry, prefix + 'classified': scores.classified})
+    return results
+
+
+def format_csv_chunk(results: dict, columns=RESULT_COLUMNS):
+    """Renders scored results as CSV rows (no header); booleans are written as 0/1"""
+    numeric = np.column_stack([np.asarray(results[name], dtype=np.int16) for name in columns])
+    if 'id' in results:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerows([patient_id, *row] for patient_id, row in zip(results['id'], numeric.tolist()))
+        return buffer.getvalue()
+    row_format = ','.join(['%d'] * len(columns)) + '\n'
+    return (row_format * len(numeric)) % tuple(numeric.ravel().tolist())
+
+
+def parse_csv_block(block: CsvBlock):
+    """Parses a CsvBlock into {column name: tuple of strings}, skipping blank lines. Raises ValueError naming the
+    line of any row whose number of fields differs from the header"""
+    columns = _select_columns(block.header, block.id_column, block.columns)
+    rows = list(csv.reader(io.StringIO(block.text)))
+    width = len(block.header)
+    if set(map(len, rows)) != {width}:
+        for line, row in enumerate(rows, block.first_line):
+            if row and len(row) != width:
+                raise ValueError(f'Line {line} has {len(row)} fields, expected {width} as in the header')
+        rows = [row for row in rows if row]
+    table = list(zip(*rows)) or [()] * width
+    chunk = {name: table[block.header.index(name)] for name in columns}
+    if block.id_column:
+        chunk['id'] = chunk.pop(block.id_column)
+    return chunk
+
+
+def parsed_chunk(block):
+    """Parses a CsvBlock from read_csv_chunks; chunks from read_parquet_chunks are already parsed"""
+    return parse_csv_block(block) if isinstance(block, CsvBlock) else block
+
+
+def chunk_rows(block):
+    """Number of patients in a CsvBlock or a parsed chunk"""
+    return block.rows if isinstance(block, CsvBlock) else len(next(iter(block.values())))
+
+
+def _scored_block(block, combined=None):
+    """Worker: scores a raw CSV block from read_csv_chunks or a parsed chunk from read_parquet_chunks, against the
+    criteria sets of combined if given"""
+    chunk = parsed_chunk(block)
+    results = classify_chunk(chunk) if combined is None else classify_versions_chunk(chunk, combined)
+    return chunk_rows(chunk), results
+
+
+def _formatted_block(block, combined=None):
+    """Worker: as _scored_block, but renders the results as CSV text so formatting also runs in parallel"""
+    n, results = _scored_block(block, combined)
+    return n, format_csv_chunk(results, RESULT_COLUMNS if combined is None else version_result_columns(combined))
+
+
+def read_csv_chunks(path: str, chunk_size: int, id_column: str = None, columns=INPUT_COLUMNS):
+    """Yields CsvBlocks of at most chunk_size raw CSV lines. Parsing is left to the workers so that the reading
+    process only splits lines; quoted fields must therefore not contain line breaks"""
+    with open(path, newline='') as f:
+        header_line = f.readline()
+        if header_line in ('', *BLANK_LINES):
+            raise ValueError(f'{path} has no header line')
+        header = next(csv.reader([header_line]))
+        _select_columns(header, id_column, columns)
+        first_line = 2
+        while lines := list(itertools.islice(f, chunk_size)):
+            rows = len(lines) - sum(map(lines.count, BLANK_LINES))
+            if rows:
+                yield CsvBlock(''.join(lines), header, columns, id_column, first_line, rows)
+            first_line += len(lines)
+
+
+def read_parquet_chunks(path: str, chunk_size: int, id_column: str = None, columns=INPUT_COLUMNS):
+    """Yields {column name: array} chunks of at most chunk_size rows; requires pyarrow. Nulls in the flag columns
+    are unchecked, as blank CSV cells are"""
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    selected = _select_columns(parquet_file.schema_arrow.names, id_column, columns)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=selected):
+        chunk = {name: _without_nulls(batch.column(name)).to_numpy(zero_copy_only=False) for name in columns}
+        if id_column:
+            chunk['id'] = batch.column(id_column).to_numpy(zero_copy_only=False)
+        yield chunk
+
+
+def _without_nulls(column):
+    """Arrow flag column with nulls replaced by unchecked (False, 0 or 'false' depending on its type); to_numpy
+    would otherwise turn them into NaN (checked, being non-zero) or None"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if not column.null_count:
+        return column
+    if pa.types.is_dictionary(column.type):
+        column = column.dictionary_decode()
+    return pc.fill_null(column, pa.scalar(False).cast(column.type))
+
+
+def _select_columns(header, id_column: str = None, columns=INPUT_COLUMNS):
+    missing = [name for name in tuple(columns) + ((id_column,) if id_column else ()) if name not in header]
+    if missing:
+        raise ValueError(f'Input is missing required columns: {", ".join(missing)}')
+    return list(columns) + ([id_column] if id_column else [])
+
+
+def results_in_order(worker, chunks, workers: int):
+    """Applies worker to each chunk, yielding results in input order. At most 2 * workers chunks are in flight
+    at any time, so a fast reader cannot queue up the whole file in memory ahead of slow workers"""
+    if workers == 1:
+        yield from map(worker, chunks)
+        return
+
+    with multiprocessing.Pool(workers) as pool:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(worker, (chunk,)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def classify_file(input_path: str, output_path: str, workers: int = 1, chunk_size: int = 100_000,
+                  id_column: str = None, criteria: list = None):
+    """Classifies every row of input_path and writes results to output_path; returns the number of rows processed.
+    criteria lists criteria set versions to score against instead of the default set"""
+    if criteria:
+        if len(set(criteria)) != len(criteria):
+            raise ValueError('Each criteria set may only be given once')
+        combined = combine_evaluators([load_evaluator(version) for version in criteria])
+        columns, result_columns = combined.keys, version_result_columns(combined)
+    else:
+        combined, columns, result_columns = None, INPUT_COLUMNS, RESULT_COLUMNS
+    read_chunks = read_parquet_chunks if input_path.endswith('.parquet') else read_csv_chunks
+    chunks = read_chunks(input_path, chunk_size, id_column, columns)
+    header = (['id'] if id_column else []) + list(result_columns)
+    scored_block = functools.partial(_scored_block, combined=combined)
+    formatted_block = functools.partial(_formatted_block, combined=combined)
+    rows = 0
+
+    if output_path.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for n, results in results_in_order(scored_block, chunks, workers):
+                table = pa.table(results)
+                writer = writer or pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table)
+                rows += n
+        finally:
+            if writer:
+                writer.close()
+    else:
+        with open(output_path, 'w', newline='') as f:
+            f.write(','.join(header) + '\n')
+            for n, text in results_in_order(formatted_block, chunks, workers):
+                f.write(text)
+                rows += n
+
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Classify a cohort (CSV or Parquet) using the 2023 ACR/EULAR '
+                                                 'APS classification criteria')
+    parser.add_argument('input', help='Cohort file with one column per criterion key and entry criterion flag')
+    parser.add_argument('output', help='Results file (.csv or .parquet)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=100_000, help='Rows per chunk')
+    parser.add_argument('--id-column', help='Column to copy to the output to identify each patient')
+    parser.add_argument('--criteria', action='append', metavar='VERSION',
+                        help='Criteria set to score against instead of the 2023 criteria, e.g. sapporo_2006 or a path '
+                             'to a criteria set file; repeat to score several sets in one pass')
+    args = parser.parse_args(argv)
+
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error('--workers and --chunk-size must be positive')
+
+    start = time.perf_counter()
+    try:
+        rows = classify_file(args.input, args.output, args.workers, args.chunk_size, args.id_column, args.criteria)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f'error: {e}\n')
+    elapsed = time.perf_counter() - start
+
+    print(f'Classified {rows:,} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/sec) '
+          f'with {args.workers} worker(s)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
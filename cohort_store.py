@@ -0,0 +1,250 @@
+"""
+Memory-mapped, bit-packed store of a scored cohort for fast repeated subgroup queries.
+
+Layout of a .apsc file: an 8-byte magic, a 4-byte little-endian header length and a JSON header (row count, criterion
+and entry keys, criteria set version and file hash, column offsets from the end of the header), followed by fixed-width
+columns, each starting on a 64-byte boundary:
+    answers     uint32  one bit per criterion, bit positions from aps_criteria.registry (as session_state.answers)
+    entry       uint16  one bit per entry criterion, bit positions from aps_criteria.ENTRY_KEYS
+    D1 ... D8   uint8   score of each domain
+    clinical    uint8   total clinical score
+    lab         uint8   total laboratory score
+    flags       uint8   bit 0 = entry criteria met, bit 1 = classified
+Queries read the columns through np.memmap one chunk of rows at a time, so only the pages a query touches are read
+and memory stays bounded regardless of cohort size. Filters are evaluated with bit operations on the packed columns:
+
+    store = CohortStore('registry.apsc')
+    store.count(classified=True, domains={8: 0})                      # classified with only D7 lab evidence
+    store.histogram('D8', any_of=[c.key for c in registry.by_domain[4]])  # D8 scores among obstetric morbidity
+
+Usage: python cohort_store.py registry.csv registry.apsc --workers 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from aps_criteria import ENTRY_KEYS, criteria_set, registry
+from classify_cohort import (BLANK_LINES, parse_flags, parsed_chunk, read_csv_chunks, read_parquet_chunks,
+                             results_in_order)
+from scoring import CRITERIA_KEYS, DOMAINS, encode_entry_matrix, encode_matrix, meets_entry_masks, score_masks
+
+MAGIC = b'APSCOHRT'
+VERSION = 2
+ALIGNMENT = 64
+MEETS_ENTRY_FLAG = 1
+CLASSIFIED_FLAG = 2
+
+DOMAIN_COLUMNS = tuple(f'D{domain}' for domain in DOMAINS)
+COLUMNS = {'answers': '<u4', 'entry': '<u2', **dict.fromkeys(DOMAIN_COLUMNS, 'u1'), 'clinical': 'u1', 'lab': 'u1',
+           'flags': 'u1'}
+
+
+def _aligned(offset: int):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _layout(rows: int):
+    """Encoded header, data section start and total file size of a store of rows patients"""
+    header = {'version': VERSION, 'rows': rows, 'criteria': list(CRITERIA_KEYS), 'entry': list(ENTRY_KEYS),
+              'criteria_set': criteria_set.version, 'sha256': criteria_set.sha256, 'columns': {}}
+    offset = 0
+    for name, dtype in COLUMNS.items():
+        header['columns'][name] = [dtype, offset]
+        offset = _aligned(offset + rows * np.dtype(dtype).itemsize)
+    header_bytes = json.dumps(header).encode()
+    data_start = _aligned(len(MAGIC) + 4 + len(header_bytes))
+    return header_bytes, data_start, data_start + offset
+
+
+def _open_columns(path: str, header: dict, data_start: int, mode: str):
+    if not header['rows']:
+        return {name: np.zeros(0, dtype=dtype) for name, (dtype, _) in header['columns'].items()}
+    return {name: np.memmap(path, dtype=dtype, mode=mode, offset=data_start + offset, shape=(header['rows'],))
+            for name, (dtype, offset) in header['columns'].items()}
+
+
+def encode_chunk(entry_flags, answers):
+    """Packs an (n, 9) entry flag matrix and an (n, 26) answer matrix (columns follow ENTRY_KEYS and CRITERIA_KEYS)
+    into the store's columns, scoring them on the way"""
+    masks = encode_matrix(answers)
+    entry = encode_entry_matrix(entry_flags)
+    scores = score_masks(masks)
+    meets_entry = meets_entry_masks(entry)
+
+    columns = {'answers': masks.astype(np.uint32),
+               'entry': entry,
+               'clinical': scores.clinical, 'lab': scores.lab,
+               'flags': meets_entry * MEETS_ENTRY_FLAG | (meets_entry & scores.classified) * CLASSIFIED_FLAG}
+    columns.update(zip(DOMAIN_COLUMNS, scores.domains.T))
+    return {name: np.asarray(values).astype(COLUMNS[name]) for name, values in columns.items()}
+
+
+class CohortStore:
+    """Read-only view of a .apsc file; see the module docstring for the layout and query examples"""
+
+    def __init__(self, path: str, chunk_size: int = 1 << 20):
+        self.path = path
+        self.chunk_size = chunk_size
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not an APS cohort store')
+            header_bytes = f.read(int.from_bytes(f.read(4), 'little'))
+        header = json.loads(header_bytes)
+        # The hash also catches edits to points or thresholds that leave the criterion and entry keys unchanged
+        if header['version'] != VERSION or header['criteria'] != list(CRITERIA_KEYS) or \
+                header['entry'] != list(ENTRY_KEYS) or header['sha256'] != criteria_set.sha256:
+            raise ValueError(f'{path} was written for a different criteria version '
+                             f'({header.get("criteria_set", "unknown")}); rebuild it')
+
+        self.rows = header['rows']
+        self.columns = _open_columns(path, header, _aligned(len(MAGIC) + 4 + len(header_bytes)), mode='r')
+
+    def __len__(self):
+        return self.rows
+
+    def select(self, start: int, stop: int, has=(), lacks=(), any_of=(), domains=None, meets_entry: bool = None,
+               classified: bool = None):
+        """Boolean mask over rows start:stop of the patients matching every filter:
+        has / lacks / any_of: criterion keys that must all be present / must all be absent / at least one present
+        domains: {domain: score} or {domain: (lowest, highest)} inclusive ranges of domain scores
+        meets_entry, classified: required entry criteria / classification status"""
+        answers = self.columns['answers'][start:stop]
+        selected = np.ones(len(answers), dtype=bool)
+
+        if has:
+            required = np.uint32(encode_keys(has))
+            selected &= (answers & required) == required
+        if lacks:
+            selected &= (answers & np.uint32(encode_keys(lacks))) == 0
+        if any_of:
+            selected &= (answers & np.uint32(encode_keys(any_of))) != 0
+        for domain, score in (domains or {}).items():
+            lowest, highest = score if isinstance(score, tuple) else (score, score)
+            values = self.columns[f'D{domain}'][start:stop]
+            selected &= (values >= lowest) & (values <= highest)
+
+        if meets_entry is not None or classified is not None:
+            flags = self.columns['flags'][start:stop]
+            if meets_entry is not None:
+                selected &= ((flags & MEETS_ENTRY_FLAG) != 0) == meets_entry
+            if classified is not None:
+                selected &= ((flags & CLASSIFIED_FLAG) != 0) == classified
+        return selected
+
+    def _chunks(self):
+        for start in range(0, self.rows, self.chunk_size):
+            yield start, min(start + self.chunk_size, self.rows)
+
+    def count(self, **filters):
+        """Number of patients matching filters (see select)"""
+        return sum(int(np.count_nonzero(self.select(start, stop, **filters))) for start, stop in self._chunks())
+
+    def histogram(self, column: str, **filters):
+        """Counts of each value of column ('D1' ... 'D8', 'clinical' or 'lab') among patients matching filters;
+        index i of the returned array is the number of patients with value i"""
+        if column not in COLUMNS or COLUMNS[column] != 'u1' or column == 'flags':
+            raise ValueError(f'Cannot build a histogram of {column!r}')
+        counts = np.zeros(256, dtype=np.int64)
+        for start, stop in self._chunks():
+            values = self.columns[column][start:stop][self.select(start, stop, **filters)]
+            counts += np.bincount(values, minlength=256)
+        return counts[:int(np.flatnonzero(counts).max(initial=0)) + 1]
+
+    def criterion_counts(self, **filters):
+        """{criterion key: number of patients matching filters who have that criterion}"""
+        counts = np.zeros(len(CRITERIA_KEYS), dtype=np.int64)
+        bits = np.arange(len(CRITERIA_KEYS), dtype=np.uint32)
+        for start, stop in self._chunks():
+            answers = self.columns['answers'][start:stop][self.select(start, stop, **filters)]
+            counts += ((answers[:, None] >> bits) & 1).sum(axis=0, dtype=np.int64)
+        return dict(zip(CRITERIA_KEYS, counts.tolist()))
+
+
+def encode_keys(keys):
+    """Answer bitmask with the bits of the given criterion keys set"""
+    unknown = [key for key in keys if key not in registry.bit_position]
+    if unknown:
+        raise KeyError(f'Unknown criterion key(s): {", ".join(unknown)}')
+    return sum(1 << registry.bit_position[key] for key in set(keys))
+
+
+def write_store(path: str, chunks, rows: int):
+    """Writes a store of rows patients from an iterable of encode_chunk() results, in row order"""
+    header_bytes, data_start, size = _layout(rows)
+    with open(path, 'wb') as f:
+        f.write(MAGIC + len(header_bytes).to_bytes(4, 'little') + header_bytes)
+        f.truncate(size)
+
+    columns = _open_columns(path, json.loads(header_bytes), data_start, mode='r+')
+    written = 0
+    for chunk in chunks:
+        n = len(chunk['answers'])
+        if written + n > rows:
+            raise ValueError(f'More than the expected {rows} rows')
+        for name, values in chunk.items():
+            columns[name][written:written + n] = values
+        written += n
+    if written != rows:
+        raise ValueError(f'Expected {rows} rows, got {written}')
+    for column in columns.values():
+        if isinstance(column, np.memmap):
+            column.flush()
+
+
+def _encoded_block(block):
+    """Worker: parses a CSV block from read_csv_chunks (or takes a Parquet chunk) and packs it with encode_chunk"""
+    chunk = parsed_chunk(block)
+    entry_flags = np.column_stack([parse_flags(chunk[key], key) for key in ENTRY_KEYS])
+    answers = np.column_stack([parse_flags(chunk[key], key) for key in CRITERIA_KEYS])
+    return encode_chunk(entry_flags, answers)
+
+
+def count_rows(path: str):
+    """Rows in a cohort file, without parsing it; blank CSV lines are not rows, as in read_csv_chunks"""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    with open(path, newline='') as f:
+        if f.readline() in ('', *BLANK_LINES):
+            raise ValueError(f'{path} has no header line')
+        return sum(line not in BLANK_LINES for line in f)
+
+
+def build_store(input_path: str, store_path: str, workers: int = 1, chunk_size: int = 100_000):
+    """Scores a cohort file (same input as classify_cohort.py) into a store; returns the number of rows"""
+    rows = count_rows(input_path)
+    read_chunks = read_parquet_chunks if input_path.endswith('.parquet') else read_csv_chunks
+    write_store(store_path, results_in_order(_encoded_block, read_chunks(input_path, chunk_size), workers), rows)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build a memory-mapped cohort store from a cohort file (CSV or '
+                                                 'Parquet) for fast subgroup queries')
+    parser.add_argument('input', help='Cohort file with one column per criterion key and entry criterion flag')
+    parser.add_argument('output', help='Store file to write (.apsc)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=100_000, help='Rows per chunk')
+    args = parser.parse_args(argv)
+
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error('--workers and --chunk-size must be positive')
+
+    start = time.perf_counter()
+    try:
+        rows = build_store(args.input, args.output, args.workers, args.chunk_size)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f'error: {e}\n')
+    elapsed = time.perf_counter() - start
+
+    print(f'Stored {rows:,} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/sec) '
+          f'with {args.workers} worker(s)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
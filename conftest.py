@@ -0,0 +1,18 @@
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption('--exhaustive', action='store_true', help='Also run tests marked exhaustive (minutes long)')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'exhaustive: opt-in exhaustive sweep, run with --exhaustive')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--exhaustive'):
+        return
+    skip = pytest.mark.skip(reason='needs --exhaustive')
+    for item in items:
+        if 'exhaustive' in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,142 @@
+"""
+Vectorized rule stage turning raw registry data into criterion flags for batch scoring.
+
+Raw columns (each an array with one entry per patient; any group may be omitted):
+    acl_igg, acl_igm, ab2gpi_igg, ab2gpi_igm    aCL / aβ2GPI titres in units (NaN = not tested)
+    lac_first_positive, lac_last_positive       dates of the first and last positive LAC test (NaT = never positive)
+    platelet_nadir                              lowest platelet count (x10^9/L)
+    vte, vte_risk_factors                       VTE event (bool) and the risk factors present at the time (lists;
+                                                None or an omitted column = none recorded)
+    ate, cvd_risk_factors                       ATE event (bool) and the CVD risk factors present (lists, as above)
+Any column named after a criterion key (e.g. livedo_racemosa) or entry flag is passed through unchanged.
+
+Thresholds follow the 2023 ACR/EULAR criteria and the app's pages: moderate titre 40-79 units, high titre >= 80 units,
+persistent LAC = positive on two occasions at least 12 weeks apart, thrombocytopenia = lowest count 20-130, a high
+risk VTE profile = one major or two minor risk factors, a high risk CVD profile = one high or three moderate factors.
+"""
+
+import numpy as np
+
+from aps_criteria import ENTRY_CLINICAL_KEYS, ENTRY_KEYS, ENTRY_LAB_KEYS, registry
+
+MODERATE_TITRE = 40
+HIGH_TITRE = 80
+PERSISTENT_LAC_INTERVAL = np.timedelta64(12 * 7, 'D')
+THROMBOCYTOPENIA_RANGE = (20, 130)
+
+VTE_MAJOR_RISK_FACTORS = ('active_malignancy', 'hospital_admission', 'major_trauma', 'surgery_over_30_min')
+VTE_MINOR_RISK_FACTORS = ('autoimmune_or_ibd', 'severe_infection', 'central_venous_catheter', 'hormone_therapy',
+                          'long_distance_travel', 'obesity', 'pregnancy_or_postpartum', 'prolonged_immobilization',
+                          'surgery_under_30_min')
+CVD_HIGH_RISK_FACTORS = ('severe_hypertension', 'chronic_kidney_disease', 'diabetes_with_organ_damage',
+                         'severe_hyperlipidemia')
+CVD_MODERATE_RISK_FACTORS = ('treated_hypertension', 'tobacco_smoking', 'diabetes_without_organ_damage',
+                             'moderate_hyperlipidemia', 'obesity')
+
+
+def count_risk_factors(factor_lists, *groups):
+    """Counts, per patient, how many listed risk factors fall in each group of factor names. factor_lists holds one
+    list of names per patient (None = no risk factors recorded); returns one (n,) count array per group. Raises
+    ValueError for unknown names"""
+    factor_lists = [() if factors is None else factors for factors in factor_lists]
+    lengths = np.fromiter(map(len, factor_lists), dtype=np.intp, count=len(factor_lists))
+    names = np.array([name for factors in factor_lists for name in factors], dtype=str)
+    patients = np.repeat(np.arange(len(lengths)), lengths)
+
+    known = np.isin(names, np.concatenate([np.asarray(group, dtype=str) for group in groups]))
+    if not known.all():
+        raise ValueError(f'Unknown risk factor {str(names[~known][0])!r}')
+    return tuple(np.bincount(patients, weights=np.isin(names, group), minlength=len(lengths)).astype(np.intp)
+                 for group in groups)
+
+
+def lac_dates_from_results(patient_index, test_date, positive, n_patients: int):
+    """Collapses long-format LAC results (one row per test) into per-patient first/last positive dates"""
+    patient_index = np.asarray(patient_index)[np.asarray(positive, dtype=bool)]
+    days = np.asarray(test_date, dtype='datetime64[D]')[np.asarray(positive, dtype=bool)].astype(np.int64)
+
+    first = np.full(n_patients, np.iinfo(np.int64).max)
+    last = np.full(n_patients, np.iinfo(np.int64).min)
+    np.minimum.at(first, patient_index, days)
+    np.maximum.at(last, patient_index, days)
+
+    tested = np.bincount(patient_index, minlength=n_patients) > 0
+    nat = np.datetime64('NaT', 'D')
+    return (np.where(tested, first.astype('datetime64[D]'), nat),
+            np.where(tested, last.astype('datetime64[D]'), nat))
+
+
+def derive_titre_criteria(acl_igg, acl_igm, ab2gpi_igg, ab2gpi_igm):
+    """D8 criteria and the aCL/aβ2GPI entry flags from titres in units (NaN = not tested, counts as negative)"""
+    acl_igg, acl_igm, ab2gpi_igg, ab2gpi_igm = (np.nan_to_num(np.asarray(titre, dtype=float))
+                                                for titre in (acl_igg, acl_igm, ab2gpi_igg, ab2gpi_igm))
+    acl_igg_high, ab2gpi_igg_high = acl_igg >= HIGH_TITRE, ab2gpi_igg >= HIGH_TITRE
+    acl_positive = (acl_igg >= MODERATE_TITRE) | (acl_igm >= MODERATE_TITRE)
+    ab2gpi_positive = (ab2gpi_igg >= MODERATE_TITRE) | (ab2gpi_igm >= MODERATE_TITRE)
+
+    return {'mod_high_igm': (acl_igm >= MODERATE_TITRE) | (ab2gpi_igm >= MODERATE_TITRE),
+            'mod_pos_igg': ((acl_igg >= MODERATE_TITRE) & ~acl_igg_high) |
+                           ((ab2gpi_igg >= MODERATE_TITRE) & ~ab2gpi_igg_high),
+            'high_pos_igg_or': acl_igg_high | ab2gpi_igg_high,
+            'high_pos_igg_and': acl_igg_high & ab2gpi_igg_high,
+            ENTRY_LAB_KEYS[1]: acl_positive,
+            ENTRY_LAB_KEYS[2]: ab2gpi_positive}
+
+
+def derive_lac_criteria(lac_first_positive, lac_last_positive):
+    """D7 criteria and the LAC entry flag from the first and last positive LAC dates"""
+    first = np.asarray(lac_first_positive, dtype='datetime64[D]')
+    last = np.asarray(lac_last_positive, dtype='datetime64[D]')
+    positive = ~np.isnat(first)
+    persistent = positive & ~np.isnat(last) & (last - first >= PERSISTENT_LAC_INTERVAL)
+
+    return {'persistent_lac': persistent,
+            'single_lac': positive & ~persistent,
+            ENTRY_LAB_KEYS[0]: positive}
+
+
+def derive_risk_profile(event, factor_lists, high_factors, moderate_factors, moderate_needed: int):
+    """(high risk profile, low risk profile) for patients with an event: high if at least one high factor or at least
+    moderate_needed moderate factors. factor_lists may be None when no risk factors were recorded for anyone"""
+    event = np.asarray(event, dtype=bool)
+    if factor_lists is None:
+        factor_lists = [()] * len(event)
+    high, moderate = count_risk_factors(factor_lists, high_factors, moderate_factors)
+    high_risk = (high >= 1) | (moderate >= moderate_needed)
+    return event & high_risk, event & ~high_risk
+
+
+def derive_criteria(raw: dict):
+    """Converts raw columns (see module docstring) into {criterion key or entry flag: (n,) bool array}. Entry clinical
+    flags that are not given explicitly are set when any criterion of the matching domain (D1-D6) is met"""
+    derived = {key: np.asarray(raw[key], dtype=bool) for key in registry.keys + ENTRY_KEYS if key in raw}
+
+    if 'acl_igg' in raw:
+        derived.update(derive_titre_criteria(raw['acl_igg'], raw['acl_igm'], raw['ab2gpi_igg'], raw['ab2gpi_igm']))
+    if 'lac_first_positive' in raw:
+        derived.update(derive_lac_criteria(raw['lac_first_positive'], raw['lac_last_positive']))
+    if 'platelet_nadir' in raw:
+        platelets = np.asarray(raw['platelet_nadir'], dtype=float)
+        low, high = THROMBOCYTOPENIA_RANGE
+        derived['thrombocytopenia'] = (platelets >= low) & (platelets <= high)
+    if 'vte' in raw:
+        derived['vte_high_risk'], derived['vte_low_risk'] = derive_risk_profile(
+            raw['vte'], raw.get('vte_risk_factors'), VTE_MAJOR_RISK_FACTORS, VTE_MINOR_RISK_FACTORS, moderate_needed=2)
+    if 'ate' in raw:
+        derived['ate_high_risk'], derived['ate_low_risk'] = derive_risk_profile(
+            raw['ate'], raw.get('cvd_risk_factors'), CVD_HIGH_RISK_FACTORS, CVD_MODERATE_RISK_FACTORS,
+            moderate_needed=3)
+
+    n = len(next(iter(derived.values()))) if derived else 0
+    for domain, key in zip(registry.by_domain, ENTRY_CLINICAL_KEYS):
+        if key not in derived:
+            domain_flags = [derived[c.key] for c in registry.by_domain[domain] if c.key in derived]
+            derived[key] = np.logical_or.reduce(domain_flags) if domain_flags else np.zeros(n, dtype=bool)
+    return derived
+
+
+def criteria_matrix(derived: dict, keys=registry.keys):
+    """Stacks derived flags into an (n, len(keys)) boolean matrix, e.g. for scoring.score_matrix (keys default to
+    the answer matrix column order) or the entry flags (keys=ENTRY_CLINICAL_KEYS); missing keys are unchecked"""
+    n = len(next(iter(derived.values())))
+    return np.column_stack([derived.get(key, np.zeros(n, dtype=bool)) for key in keys])
@@ -0,0 +1,124 @@
+"""
+Compiled evaluators for the declarative criteria sets in criteria_sets/, and scoring of one cohort against several
+criteria versions (e.g. aps_2023 and sapporo_2006) in a single vectorized pass.
+
+An Evaluator is the scoring-ready form of a criteria set: criterion keys in registry order with their points, the
+start column of each domain, the number of clinical domains, the thresholds and the entry criteria keys. scoring.py
+scores the default set with its Evaluator, and classify_cohort.py --criteria scores a cohort against several. Loading
+and compiling a set takes well under a millisecond, so evaluators are not cached.
+
+To score several versions at once, combine_evaluators() lays the domains of every set side by side: each set's
+criteria columns are gathered from one shared input matrix (criteria shared between sets, e.g. persistent_lac, are
+read from the same column), a single np.maximum.reduceat yields every domain of every set, and the totals of all sets
+are one matrix product with a (domains x sets) weight matrix.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from aps_criteria import load_criteria_set
+
+# keys: criterion keys in registry order (grouped by domain, ordered by points); points: (len(keys),) int8
+# domains: domain numbers, clinical first; domain_starts: index in keys of each domain's first criterion
+Evaluator = namedtuple('Evaluator', ['version', 'name', 'keys', 'points', 'domains', 'domain_starts',
+                                     'n_clinical_domains', 'clinical_threshold', 'lab_threshold', 'entry_clinical_keys',
+                                     'entry_lab_keys'])
+
+# Several evaluators laid side by side over the columns of one input matrix (see combine_evaluators)
+CombinedEvaluator = namedtuple('CombinedEvaluator', ['evaluators', 'keys', 'gather', 'points', 'domain_starts',
+                                                     'domain_slices', 'clinical_weights', 'lab_weights',
+                                                     'entry_columns', 'entry_clinical_weights', 'entry_lab_weights'])
+
+VersionScores = namedtuple('VersionScores', ['domains', 'clinical', 'lab', 'meets_entry', 'classified'])
+
+
+def compile_evaluator(criteria_set):
+    """Evaluator of an aps_criteria.CriteriaSet"""
+    registry = criteria_set.registry
+    domains = tuple(registry.by_domain)
+    return Evaluator(version=criteria_set.version, name=criteria_set.name,
+                     keys=registry.keys,
+                     points=np.array([points for domain in domains for points in registry.domain_points[domain]],
+                                     dtype=np.int8),
+                     domains=domains,
+                     domain_starts=np.array([registry.domain_shift[domain] for domain in domains]),
+                     n_clinical_domains=len(criteria_set.clinical_domains),
+                     clinical_threshold=criteria_set.clinical_threshold, lab_threshold=criteria_set.lab_threshold,
+                     entry_clinical_keys=tuple(criteria_set.entry_clinical),
+                     entry_lab_keys=tuple(criteria_set.entry_lab))
+
+
+def load_evaluator(version: str):
+    """Evaluator of a criteria set file (a version such as 'sapporo_2006' or a path, see
+    aps_criteria.criteria_set_path)"""
+    return compile_evaluator(load_criteria_set(version))
+
+
+def combine_evaluators(evaluators, keys=None):
+    """Prepares several evaluators for score_versions. keys are the columns of the input matrix; by default every
+    entry criterion and criterion key of the evaluators, in order of first appearance"""
+    if keys is None:
+        keys = tuple(dict.fromkeys(key for evaluator in evaluators for key in evaluator.entry_clinical_keys +
+                                   evaluator.entry_lab_keys + evaluator.keys))
+    column = {key: index for index, key in enumerate(keys)}
+    missing = [key for evaluator in evaluators for key in evaluator.keys + evaluator.entry_clinical_keys +
+               evaluator.entry_lab_keys if key not in column]
+    if missing:
+        raise ValueError(f'Input columns are missing keys: {", ".join(dict.fromkeys(missing))}')
+
+    gather, starts = [], []
+    for evaluator in evaluators:
+        starts += (evaluator.domain_starts + len(gather)).tolist()
+        gather += [column[key] for key in evaluator.keys]
+    n_domains = [len(evaluator.domains) for evaluator in evaluators]
+    domain_slices = tuple(slice(end - n, end) for n, end in zip(n_domains, np.cumsum(n_domains).tolist()))
+
+    # (domains x sets) weights: 1 where the domain belongs to the set and counts towards its clinical / lab total
+    one_hot = np.repeat(np.arange(len(evaluators)), n_domains)[:, None] == np.arange(len(evaluators))
+    is_clinical = np.concatenate([np.arange(len(evaluator.domains)) < evaluator.n_clinical_domains
+                                  for evaluator in evaluators])[:, None]
+
+    # (entry columns x sets) weights: 1 where the column is one of the set's clinical / laboratory entry criteria
+    entry_columns = list(dict.fromkeys(column[key] for evaluator in evaluators
+                                       for key in evaluator.entry_clinical_keys + evaluator.entry_lab_keys))
+    entry_keys = [keys[index] for index in entry_columns]
+    entry_clinical_weights = np.array([[key in evaluator.entry_clinical_keys for evaluator in evaluators]
+                                       for key in entry_keys], dtype=np.int16).reshape(-1, len(evaluators))
+    entry_lab_weights = np.array([[key in evaluator.entry_lab_keys for evaluator in evaluators]
+                                  for key in entry_keys], dtype=np.int16).reshape(-1, len(evaluators))
+
+    return CombinedEvaluator(evaluators=tuple(evaluators), keys=tuple(keys), gather=np.array(gather, dtype=np.intp),
+                             points=np.concatenate([evaluator.points for evaluator in evaluators]),
+                             domain_starts=np.array(starts, dtype=np.intp), domain_slices=domain_slices,
+                             clinical_weights=(one_hot & is_clinical).astype(np.int16),
+                             lab_weights=(one_hot & ~is_clinical).astype(np.int16),
+                             entry_columns=np.array(entry_columns, dtype=np.intp),
+                             entry_clinical_weights=entry_clinical_weights, entry_lab_weights=entry_lab_weights)
+
+
+def score_versions(matrix, combined: CombinedEvaluator):
+    """Scores a boolean (n, len(combined.keys)) matrix against every combined criteria set in one pass.
+    Returns {version: VersionScores} with (n, domains of that set) domain scores, clinical and lab totals, entry
+    criteria (always met for sets without entry criteria) and classification"""
+    matrix = np.asarray(matrix, dtype=bool)
+    if matrix.ndim != 2 or matrix.shape[1] != len(combined.keys):
+        raise ValueError(f'Expected an (n_patients, {len(combined.keys)}) matrix, got shape {matrix.shape}')
+
+    points = np.where(matrix[:, combined.gather], combined.points, np.int8(0))
+    domains = np.maximum.reduceat(points, combined.domain_starts, axis=1)
+    clinical = domains.astype(np.int16) @ combined.clinical_weights
+    lab = domains.astype(np.int16) @ combined.lab_weights
+
+    entry = matrix[:, combined.entry_columns].astype(np.int16)
+    has_clinical_entry = combined.entry_clinical_weights.any(axis=0)
+    has_lab_entry = combined.entry_lab_weights.any(axis=0)
+    meets_entry = (((entry @ combined.entry_clinical_weights) > 0) | ~has_clinical_entry) & \
+        (((entry @ combined.entry_lab_weights) > 0) | ~has_lab_entry)
+
+    thresholds = np.array([(e.clinical_threshold, e.lab_threshold) for e in combined.evaluators]).T
+    classified = meets_entry & (clinical >= thresholds[0]) & (lab >= thresholds[1])
+
+    return {evaluator.version: VersionScores(domains[:, combined.domain_slices[index]], clinical[:, index],
+                                             lab[:, index], meets_entry[:, index], classified[:, index])
+            for index, evaluator in enumerate(combined.evaluators)}
@@ -0,0 +1,161 @@
+"""
+Bulk export of EMR reports for a whole cohort, in the exact layout of the web app's score page.
+
+The input is the same cohort file as for classify_cohort.py (CSV or Parquet, one column per criterion key and entry
+criterion flag). It is streamed in fixed-size chunks; each chunk is scored and rendered in a worker process and
+written out in input order, so memory stays bounded regardless of cohort size. Each chunk is scored and rendered in
+one vectorized pass rather than through the web app's result cache: patients of a cohort rarely share answer sets, and
+a cache lookup per patient only makes the export slower. The output format follows the extension:
+    .txt    a single text file: for each patient a "Patient <id>" line, the result line and the report block
+    .zip    a per-patient archive holding one <id>.txt file (result line and report block) per patient, stored
+            uncompressed unless --compress is given (deflating every small report separately doubles the export time).
+            Path separators, control characters and '..' in ids are replaced by '_', and repeated ids get a -2, -3, ...
+            suffix, so that every patient has their own file and extracting the archive stays inside its directory
+    .jsonl  JSON Lines: one object per patient with the domain scores, totals, entry criteria, classification and
+            result text, for machine consumption
+Patients are identified by --id-column, or otherwise by their 1-based row number in the input.
+
+Usage: python export_reports.py registry.csv reports.zip --id-column mrn --workers 8
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import zipfile
+
+import numpy as np
+
+from classify_cohort import (chunk_rows, classify_chunk, parsed_chunk, read_csv_chunks, read_parquet_chunks,
+                             results_in_order)
+from scoring import DOMAINS, RESULT_TEXT, format_reports
+
+FORMATS = ('.txt', '.zip', '.jsonl')
+
+# Single JSON Lines record with positional fields: id (JSON-encoded), D1-D8, clinical, lab, meets_entry, classified,
+# result (JSON-encoded)
+JSONL_FORMAT = ('{"id": %s, "domains": {' + ', '.join(f'"D{domain}": %d' for domain in DOMAINS) + '}, '
+                '"clinical": %d, "lab": %d, "meets_entry": %s, "classified": %s, "result": %s}\n')
+_JSON_BOOLEANS = ('false', 'true')
+_JSON_RESULT_TEXT = {classified: json.dumps(text) for classified, text in RESULT_TEXT.items()}
+_UNSAFE_IN_NAME = re.compile(r'[\x00-\x1f/\\:]|\.\.')
+
+
+def patient_ids(results: dict, offset: int):
+    """Ids of a scored chunk: the id column if present, otherwise 1-based row numbers starting after offset rows"""
+    if 'id' in results:
+        return [str(patient_id) for patient_id in results['id']]
+    return [str(row) for row in range(offset + 1, offset + 1 + len(results['clinical']))]
+
+
+def render_reports(results: dict):
+    """Result line and report block of every patient in a scored chunk (see classify_cohort.classify_chunk)"""
+    domains = np.column_stack([results[f'D{domain}'] for domain in DOMAINS])
+    reports = format_reports(domains, results['clinical'], results['lab'])
+    return [f'Result: {RESULT_TEXT[classified]}\n{report}'
+            for classified, report in zip(np.asarray(results['classified'], dtype=bool).tolist(), reports)]
+
+
+def archive_name(patient_id: str, taken: set):
+    """File name of a patient's report in a .zip archive, unique among taken (case-insensitively, as on Windows and
+    macOS file systems), which it is added to"""
+    stem = _UNSAFE_IN_NAME.sub('_', patient_id).lstrip('.') or '_'
+    name, suffix = stem, 1
+    while name.casefold() in taken:
+        suffix += 1
+        name = f'{stem}-{suffix}'
+    taken.add(name.casefold())
+    return f'{name}.txt'
+
+
+def render_jsonl(results: dict, ids: list):
+    """JSON Lines text for a scored chunk, one record per patient"""
+    columns = [np.asarray(results[f'D{domain}']).tolist() for domain in DOMAINS]
+    columns += [np.asarray(results['clinical']).tolist(), np.asarray(results['lab']).tolist()]
+    meets_entry = np.asarray(results['meets_entry'], dtype=bool).tolist()
+    classified = np.asarray(results['classified'], dtype=bool).tolist()
+    return ''.join(JSONL_FORMAT % (json.dumps(patient_id), *values, _JSON_BOOLEANS[entry], _JSON_BOOLEANS[result],
+                                   _JSON_RESULT_TEXT[result])
+                   for patient_id, *values, entry, result in zip(ids, *columns, meets_entry, classified))
+
+
+def _rendered_block(job):
+    """Worker: scores one (format, offset, block) job and renders it as the text for that format; for .zip returns
+    the list of (patient id, report) pairs instead"""
+    output_format, offset, block = job
+    results = classify_chunk(parsed_chunk(block))
+    ids = patient_ids(results, offset)
+    if output_format == '.jsonl':
+        return len(ids), render_jsonl(results, ids)
+    reports = render_reports(results)
+    if output_format == '.zip':
+        return len(ids), list(zip(ids, reports))
+    return len(ids), ''.join(f'Patient {patient_id}\n{report}\n' for patient_id, report in zip(ids, reports))
+
+
+def _jobs(output_format: str, blocks):
+    """(format, offset, block) jobs for _rendered_block, offset being the number of patients in earlier blocks (chunks
+    may hold fewer than chunk_size rows, e.g. CSV blocks with blank lines or Parquet batches at row group ends)"""
+    offset = 0
+    for block in blocks:
+        yield output_format, offset, block
+        offset += chunk_rows(block)
+
+
+def export_reports(input_path: str, output_path: str, workers: int = 1, chunk_size: int = 100_000,
+                   id_column: str = None, compress: bool = False):
+    """Scores every row of input_path and writes its report to output_path (.txt, .zip or .jsonl); returns the
+    number of rows processed. compress deflates the files of a .zip archive"""
+    output_format = os.path.splitext(output_path)[1].lower()
+    if output_format not in FORMATS:
+        raise ValueError(f'Output must end in one of {", ".join(FORMATS)}')
+
+    read_chunks = read_parquet_chunks if input_path.endswith('.parquet') else read_csv_chunks
+    jobs = _jobs(output_format, read_chunks(input_path, chunk_size, id_column))
+    rows = 0
+
+    if output_format == '.zip':
+        taken = set()  # Names are made unique here rather than in the workers, which only see their own chunk
+        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED) as archive:
+            for n, reports in results_in_order(_rendered_block, jobs, workers):
+                for patient_id, report in reports:
+                    archive.writestr(archive_name(patient_id, taken), report)
+                rows += n
+    else:
+        with open(output_path, 'w') as f:
+            for n, text in results_in_order(_rendered_block, jobs, workers):
+                f.write(text)
+                rows += n
+
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write EMR reports for a cohort (CSV or Parquet) scored with the '
+                                                 '2023 ACR/EULAR APS classification criteria')
+    parser.add_argument('input', help='Cohort file with one column per criterion key and entry criterion flag')
+    parser.add_argument('output', help='Reports file: .txt (one file), .zip (one file per patient) or .jsonl')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    parser.add_argument('--chunk-size', type=int, default=100_000, help='Rows per chunk')
+    parser.add_argument('--id-column', help='Column identifying each patient (default: row number)')
+    parser.add_argument('--compress', action='store_true', help='Deflate the reports in a .zip archive')
+    args = parser.parse_args(argv)
+
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error('--workers and --chunk-size must be positive')
+
+    start = time.perf_counter()
+    try:
+        rows = export_reports(args.input, args.output, args.workers, args.chunk_size, args.id_column, args.compress)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f'error: {e}\n')
+    elapsed = time.perf_counter() - start
+
+    print(f'Wrote {rows:,} reports in {elapsed:.2f}s ({rows / elapsed:,.0f} reports/sec) '
+          f'with {args.workers} worker(s)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Vectorized "what's missing" analysis for patients who do not (yet) reach the classification thresholds.
+
+Only the highest score per domain counts, so adding a criterion to a domain raises the total by its points minus the
+domain's current score (or not at all). These gains depend only on the criterion and the domain's current score, and
+are precomputed once:
+    GAIN_TABLE[column, score]            gain from adding the criterion in that answer matrix column
+    BEST_GAIN_TABLE[domain index, score] gain from adding the domain's top criterion
+For a whole cohort, analyze_gaps() then needs a few table lookups plus a sort over the eight domains per patient:
+    - the clinical and laboratory deficits (points still missing to reach 3 and 3)
+    - the gain of every criterion, and which criteria would close a deficit on their own (e.g. persistent_lac for a
+      patient with a single positive LAC and no aPL serology)
+    - the minimal number of additional criteria: one per domain at most, taking the domains with the largest gains
+      first, until the deficit is covered
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from aps_criteria import registry
+from scoring import CLINICAL_DOMAINS, CLINICAL_THRESHOLD, CRITERIA_KEYS, DOMAINS, LAB_THRESHOLD, POINTS
+
+MAX_SCORE = int(POINTS.max())
+COLUMN_DOMAIN = np.repeat(np.arange(len(DOMAINS)), [registry.domain_width[domain] for domain in DOMAINS])
+CLINICAL_COLUMNS = COLUMN_DOMAIN < len(CLINICAL_DOMAINS)
+
+_scores = np.arange(MAX_SCORE + 1)
+GAIN_TABLE = np.maximum(POINTS[:, None] - _scores, 0).astype(np.int8)
+BEST_GAIN_TABLE = np.maximum(np.array([max(registry.domain_points[domain]) for domain in DOMAINS])[:, None] - _scores,
+                             0).astype(np.int8)
+
+Gaps = namedtuple('Gaps', ['clinical_deficit', 'lab_deficit', 'gains', 'closes', 'clinical_additions',
+                           'lab_additions', 'additions'])
+
+
+def minimal_additions(best_gains, deficit):
+    """Fewest domains whose best gains (n, k) add up to at least deficit (n,); 0 where there is no deficit"""
+    ordered = -np.sort(-best_gains, axis=1)
+    reached = np.cumsum(ordered, axis=1) >= deficit[:, None]
+    return np.where(deficit > 0, reached.argmax(axis=1) + 1, 0).astype(np.int8)
+
+
+def analyze_gaps(domains):
+    """Gap analysis of an (n, len(DOMAINS)) domain score array (e.g. Scores.domains from scoring.score_matrix).
+    Returns Gaps with:
+    clinical_deficit, lab_deficit: (n,) points missing to CLINICAL_THRESHOLD and LAB_THRESHOLD (0 if reached)
+    gains: (n, len(CRITERIA_KEYS)) points each criterion would add (columns follow CRITERIA_KEYS)
+    closes: (n, len(CRITERIA_KEYS)) boolean, True if adding that criterion alone closes a non-zero clinical or
+        laboratory deficit
+    clinical_additions, lab_additions, additions: (n,) minimal number of criteria to add to reach the thresholds"""
+    domains = np.asarray(domains, dtype=np.intp)
+    n_clinical = len(CLINICAL_DOMAINS)
+    clinical_deficit = np.maximum(CLINICAL_THRESHOLD - domains[:, :n_clinical].sum(axis=1), 0).astype(np.int8)
+    lab_deficit = np.maximum(LAB_THRESHOLD - domains[:, n_clinical:].sum(axis=1), 0).astype(np.int8)
+
+    gains = GAIN_TABLE[np.arange(len(CRITERIA_KEYS)), domains[:, COLUMN_DOMAIN]]
+    deficit = np.where(CLINICAL_COLUMNS, clinical_deficit[:, None], lab_deficit[:, None])
+    closes = (deficit > 0) & (gains >= deficit)
+
+    best_gains = BEST_GAIN_TABLE[np.arange(len(DOMAINS)), domains]
+    clinical_additions = minimal_additions(best_gains[:, :n_clinical], clinical_deficit)
+    lab_additions = minimal_additions(best_gains[:, n_clinical:], lab_deficit)
+
+    return Gaps(clinical_deficit=clinical_deficit, lab_deficit=lab_deficit, gains=gains, closes=closes,
+                clinical_additions=clinical_additions, lab_additions=lab_additions,
+                additions=clinical_additions + lab_additions)
+
+
+def upgrade_options(gaps: Gaps, row: int):
+    """Criterion keys that would close one of patient row's deficits on their own, with the points each adds"""
+    return {CRITERIA_KEYS[column]: int(gaps.gains[row, column]) for column in np.flatnonzero(gaps.closes[row])}
@@ -0,0 +1,153 @@
+"""
+Opt-in metrics for the web app, exported in the Prometheus/OpenMetrics text format.
+
+Enabled by environment variables when the app starts:
+    APS_METRICS_PORT=9464                 serve the metrics at http://<host>:9464/metrics
+    APS_METRICS_FILE=/path/metrics.prom   rewrite the file every APS_METRICS_INTERVAL seconds (default 15) and at exit
+When neither is set, metrics.timed() returns the decorated function unchanged and callers guard other updates with
+`if metrics.enabled`, so the disabled overhead is a single attribute check.
+
+Metrics are process-wide: Streamlit runs every session's script in the same process.
+"""
+
+import atexit
+import bisect
+import functools
+import http.server
+import os
+import threading
+import time
+from collections import defaultdict
+
+# Histogram buckets (seconds) from 10 µs, for scoring, up to 10 s, for slow page renders
+BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+           10)
+
+# Metric families; a counter's samples carry the _total suffix, e.g. aps_sessions_total
+METRICS = {
+    'aps_sessions': ('counter', 'Sessions started'),
+    'aps_reruns': ('counter', 'Script reruns, by page rendered'),
+    'aps_widget_reruns': ('counter', 'Reruns triggered by a widget change, by page'),
+    'aps_rerun_seconds': ('histogram', 'Duration of a full script rerun'),
+    'aps_page_render_seconds': ('histogram', 'Duration of a page function, by page'),
+    'aps_scoring_seconds': ('histogram', 'Duration of calculate_scores()'),
+}
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        with self._lock:
+            self._counters[name, tuple(sorted(labels.items()))] += amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = name, tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, [0] * (len(BUCKETS) + 2))
+            histogram[bisect.bisect_left(BUCKETS, value)] += 1
+            histogram[-1] += value
+
+    def timed(self, name: str, counter: str = None, **labels):
+        """Decorator recording each call's duration in histogram name (and counting calls in counter, if given).
+        Returns the function unchanged while metrics are disabled"""
+        def decorator(function):
+            if not self.enabled:
+                return function
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    # Also reached when Streamlit interrupts the function with st.rerun()
+                    self.observe(name, time.perf_counter() - start, **labels)
+                    if counter:
+                        self.inc(counter, **labels)
+            return wrapper
+        return decorator
+
+    def render(self):
+        """Current values in the OpenMetrics text format"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}_total{_labels(labels)} {value:g}')
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric == name:
+                    cumulative = 0
+                    for bound, count in zip([str(float(bound)) for bound in BUCKETS] + ['+Inf'], values):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {values[-1]:.9g}')
+                    lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str):
+        """Atomically replaces path with the current metrics"""
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as f:
+            f.write(self.render())
+        os.replace(temporary, path)
+
+    def serve(self, port: int, host: str = '0.0.0.0'):
+        """Serves /metrics from a daemon thread"""
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200 if self.path.startswith('/metrics') else 404)
+                self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='aps-metrics-http', daemon=True).start()
+        return server
+
+    def flush_periodically(self, path: str, interval: float):
+        """Rewrites path every interval seconds from a daemon thread, and once more at exit"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.write(path)
+
+        threading.Thread(target=loop, name='aps-metrics-file', daemon=True).start()
+        atexit.register(self.write, path)
+
+
+def _labels(labels: tuple):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+def configure_from_environment(metrics: Metrics, environ=os.environ):
+    port, path = environ.get('APS_METRICS_PORT'), environ.get('APS_METRICS_FILE')
+    if port:
+        metrics.serve(int(port))
+    if path:
+        metrics.flush_periodically(path, float(environ.get('APS_METRICS_INTERVAL', 15)))
+    metrics.enabled = bool(port or path)
+
+
+# Process-wide instance, configured once when the module is first imported
+metrics = Metrics()
+configure_from_environment(metrics)
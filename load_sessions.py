@@ -0,0 +1,129 @@
+"""
+Local harness simulating many concurrent app sessions. Each simulated clinician runs main.py in Streamlit's AppTest
+harness, ticks random entry and additive criteria and clicks through all ten pages to the score. All sessions stay
+open at the same time and their clicks are interleaved round-robin (AppTest is not thread-safe, and the server runs
+scripts under one GIL anyway). Reports throughput (script runs and completed sessions per second), run latency and
+the memory held per live session.
+
+Simulated sessions are not recorded in the audit log (APS_AUDIT_DB is set to an empty string).
+
+Usage: python load_sessions.py --sessions 200 [--trace-memory]
+"""
+
+import argparse
+import logging
+import os
+import pickle
+import random
+import statistics
+import resource
+import time
+import tracemalloc
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+N_PAGES = 10
+
+
+def simulate_session(seed: int, latencies: list, probability: float = 0.2):
+    """Generator clicking through every page of one session; yields after each script run and returns the AppTest"""
+    from streamlit.testing.v1 import AppTest
+
+    os.environ['APS_AUDIT_DB'] = ''  # Simulated sessions must not be recorded in the audit log
+    rng = random.Random(seed)
+    app = AppTest.from_file(MAIN_SCRIPT, default_timeout=60)
+
+    def run(element=None):
+        start = time.perf_counter()
+        (element or app).run()
+        latencies.append(time.perf_counter() - start)
+        if app.exception:
+            raise RuntimeError(app.exception[0].value)
+
+    run()
+    yield
+    # Entry page: at least one clinical and one lab criterion so that the additive pages are reachable
+    app.checkbox(key='entry_clinical_0').check()
+    app.checkbox(key='entry_lab_0').check()
+    run()
+    yield
+    run(app.button[0].click())
+    yield
+
+    for _ in range(1, N_PAGES - 1):
+        for checkbox in app.checkbox:
+            if rng.random() < probability:
+                run(checkbox.check())
+                yield
+        run(app.button[-1].click())  # Next / Calculate score
+        yield
+
+    if not app.code:
+        raise RuntimeError(f'Session {seed} did not reach the score page')
+    return app
+
+
+def run_sessions(seeds, latencies: list):
+    """Steps all sessions round-robin until every one reaches the score page; returns their AppTests"""
+    active = {seed: simulate_session(seed, latencies) for seed in seeds}
+    finished = {}
+    while active:
+        for seed, session in list(active.items()):
+            try:
+                next(session)
+            except StopIteration as done:
+                finished[seed] = done.value
+                del active[seed]
+    return list(finished.values())
+
+
+def session_state_bytes(app):
+    """Pickled size of the session's user-visible state (page counter, packed answers, widget values)"""
+    state = {key: app.session_state[key] for key in app.session_state._state.filtered_state}
+    return len(pickle.dumps(state))
+
+
+def rss_bytes():
+    """Resident set size of this process (Linux), falling back to the peak RSS elsewhere"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate concurrent sessions of the APS web app')
+    parser.add_argument('--sessions', type=int, default=100, help='Number of simulated concurrent sessions')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Also count Python allocations per session with tracemalloc (slows every run down)')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    run_sessions([args.seed], [])  # warm-up: imports Streamlit and compiles the script outside the measurement
+
+    latencies = []
+    if args.trace_memory:
+        tracemalloc.start()
+    rss_before, traced_before = rss_bytes(), tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    sessions = run_sessions(range(args.seed + 1, args.seed + 1 + args.sessions), latencies)
+    elapsed = time.perf_counter() - start
+    rss_after, traced_after = rss_bytes(), tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    state_bytes = [session_state_bytes(app) for app in sessions]
+
+    print(f'{args.sessions} concurrent sessions, {len(latencies):,} script runs in {elapsed:.2f}s: '
+          f'{len(latencies) / elapsed:,.0f} runs/s, {args.sessions / elapsed:,.1f} sessions/s')
+    print(f'run latency p50 {percentiles[49] * 1000:.1f} ms, p99 {percentiles[98] * 1000:.1f} ms')
+    print(f'memory per live session: RSS {(rss_after - rss_before) / args.sessions / 1024:,.1f} KiB, '
+          f'session state {statistics.mean(state_bytes):,.0f} bytes pickled')
+    if args.trace_memory:
+        traced = (traced_after - traced_before) / args.sessions
+        print(f'traced Python allocations per live session {traced / 1024:,.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
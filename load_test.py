@@ -0,0 +1,92 @@
+"""
+Load test for service.py: opens --concurrency keep-alive connections and sends --requests requests in total,
+then reports throughput and p50/p99 latency. Patients are random synthetic answer sets.
+
+Usage: python load_test.py --port 8000 --concurrency 64 --requests 20000 [--batch-size 1000]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from service import FLAG_KEYS
+
+
+def random_patient(rng: random.Random, probability: float = 0.15):
+    return {key: True for key in FLAG_KEYS if rng.random() < probability}
+
+
+def build_request(host: str, batch_size: int, rng: random.Random):
+    if batch_size:
+        path, payload = '/score/batch', {'patients': [random_patient(rng) for _ in range(batch_size)]}
+    else:
+        path, payload = '/score', random_patient(rng)
+    body = json.dumps(payload).encode()
+    return (f'POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n\r\n').encode() + body
+
+
+async def read_response(reader: asyncio.StreamReader):
+    status_line = await reader.readline()
+    length = 0
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+async def client(host: str, port: int, requests: list, latencies: list, errors: list):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for request in requests:
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run(host: str, port: int, concurrency: int, n_requests: int, batch_size: int, seed: int):
+    rng = random.Random(seed)
+    # A small pool of prebuilt requests keeps the client's own CPU use out of the measurement
+    pool = [build_request(host, batch_size, rng) for _ in range(min(n_requests, 256))]
+    per_client = [[pool[i % len(pool)] for i in range(c, n_requests, concurrency)] for c in range(concurrency)]
+
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, requests, latencies, errors) for requests in per_client if requests))
+    return time.perf_counter() - start, latencies, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test for the APS scoring service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--concurrency', type=int, default=64, help='Number of concurrent connections')
+    parser.add_argument('--requests', type=int, default=10_000, help='Total number of requests')
+    parser.add_argument('--batch-size', type=int, default=0, help='Patients per /score/batch request (0 = /score)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    elapsed, latencies, errors = asyncio.run(run(args.host, args.port, args.concurrency, args.requests,
+                                                 args.batch_size, args.seed))
+
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    patients = len(latencies) * (args.batch_size or 1)
+    print(f'{len(latencies):,} requests in {elapsed:.2f}s: {len(latencies) / elapsed:,.0f} req/s, '
+          f'{patients / elapsed:,.0f} patients/s, {len(errors)} error(s)')
+    print(f'latency p50 {percentiles[49] * 1000:.2f} ms, p99 {percentiles[98] * 1000:.2f} ms, '
+          f'max {max(latencies) * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Incremental longitudinal classification over time-stamped events.
+
+Each event is (patient, date, key), where key is a criterion key (e.g. 'vte_low_risk', 'persistent_lac') or an entry
+flag (e.g. 'entry_lab_1' for a moderate-high aCL that does not itself score). Events are kept per patient in
+date-ordered indexes, so adding or retracting one event only re-evaluates that patient:
+    - additive scores use every active event (only the highest score per domain counts, as in calculate_scores())
+    - entry criteria are met when a laboratory event (D7/D8 or entry_lab_*) falls within three years of a clinical
+      event (D1-D6 or entry_clinical_*), as required on the entry criteria page
+Every classification flip is recorded, and changes_since() returns the feed of flips after a given timestamp.
+"""
+
+import bisect
+import datetime
+import time
+from collections import Counter, namedtuple
+from operator import attrgetter
+
+from aps_criteria import ENTRY_CLINICAL_KEYS, ENTRY_LAB_KEYS, registry
+from scoring import CLINICAL_DOMAINS, LAB_DOMAINS, assess
+
+ENTRY_WINDOW_YEARS = 3
+
+_CLINICAL_KEYS = frozenset(ENTRY_CLINICAL_KEYS).union(c.key for d in CLINICAL_DOMAINS for c in registry.by_domain[d])
+_LAB_KEYS = frozenset(ENTRY_LAB_KEYS).union(c.key for d in LAB_DOMAINS for c in registry.by_domain[d])
+
+Status = namedtuple('Status', ['scores', 'clinical', 'lab', 'meets_entry', 'classified'])
+Change = namedtuple('Change', ['recorded_at', 'patient_id', 'classified'])
+
+
+class PatientHistory:
+    """Date-ordered events of one patient plus the state derived from them"""
+
+    def __init__(self):
+        self.events = []  # sorted (date, key)
+        self.key_counts = Counter()
+        self.answers = 0  # bitmask of criteria with at least one active event
+        self.clinical_dates = []  # sorted
+        self.lab_dates = []  # sorted
+        self.meets_entry = False
+
+    def add(self, date: datetime.date, key: str):
+        bisect.insort(self.events, (date, key))
+        self.key_counts[key] += 1
+        if key in registry.bit_position:
+            self.answers |= 1 << registry.bit_position[key]
+
+        # Adding an event can only satisfy the entry criteria, so only the new event's window needs checking
+        if key in _CLINICAL_KEYS:
+            bisect.insort(self.clinical_dates, date)
+            self.meets_entry = self.meets_entry or _any_within(self.lab_dates, date)
+        if key in _LAB_KEYS:
+            bisect.insort(self.lab_dates, date)
+            self.meets_entry = self.meets_entry or _any_within(self.clinical_dates, date)
+
+    def retract(self, date: datetime.date, key: str):
+        index = bisect.bisect_left(self.events, (date, key))
+        if index == len(self.events) or self.events[index] != (date, key):
+            raise KeyError(f'No {key!r} event on {date}')
+        del self.events[index]
+
+        self.key_counts[key] -= 1
+        if not self.key_counts[key]:
+            del self.key_counts[key]
+            if key in registry.bit_position:
+                self.answers &= ~(1 << registry.bit_position[key])
+
+        if key in _CLINICAL_KEYS:
+            self.clinical_dates.pop(bisect.bisect_left(self.clinical_dates, date))
+        if key in _LAB_KEYS:
+            self.lab_dates.pop(bisect.bisect_left(self.lab_dates, date))
+        # Retracting can break the pair that satisfied the entry criteria, so re-check this patient's pairs
+        if self.meets_entry:
+            self.meets_entry = any(_any_within(self.clinical_dates, lab_date) for lab_date in self.lab_dates)
+
+    def status(self):
+        return Status(*assess(self.answers, self.meets_entry))
+
+
+def years_later(date: datetime.date, years: int):
+    """date shifted by whole calendar years (negative to go back); Feb 29 becomes Feb 28 outside leap years"""
+    try:
+        return date.replace(year=date.year + years)
+    except ValueError:
+        return date.replace(year=date.year + years, day=28)
+
+
+def _any_within(sorted_dates: list, date: datetime.date, years: int = ENTRY_WINDOW_YEARS):
+    """True if any date in sorted_dates lies within years calendar years of date, either side: the later of the two
+    dates may be at most the earlier one shifted by years (so 2021-01-01 pairs with 2024-01-01 but not 2024-01-02)"""
+    earliest = years_later(date, -years)
+    if (date.month, date.day) == (2, 29):
+        earliest += datetime.timedelta(days=1)  # Feb 28 of that year shifts to Feb 28, before this Feb 29
+    index = bisect.bisect_left(sorted_dates, earliest)
+    return index < len(sorted_dates) and sorted_dates[index] <= years_later(date, years)
+
+
+class LongitudinalClassifier:
+    """Keeps every patient's event history and classification up to date as events are added or retracted"""
+
+    def __init__(self):
+        self.patients = {}
+        self.classified = {}
+        self.changes = []  # Change records ordered by recorded_at
+
+    def add_event(self, patient_id, date: datetime.date, key: str, recorded_at: float = None):
+        """Adds an event; returns True if the patient's classification flipped"""
+        _check_key(key)
+        self.patients.setdefault(patient_id, PatientHistory()).add(date, key)
+        return self._reclassify(patient_id, recorded_at)
+
+    def retract_event(self, patient_id, date: datetime.date, key: str, recorded_at: float = None):
+        """Retracts a previously added event; returns True if the patient's classification flipped"""
+        if patient_id not in self.patients:
+            raise KeyError(f'Unknown patient {patient_id!r}')
+        self.patients[patient_id].retract(date, key)
+        return self._reclassify(patient_id, recorded_at)
+
+    def add_events(self, events, recorded_at: float = None):
+        """Adds (patient_id, date, key) events; returns the ids of patients whose classification flipped. Raises
+        KeyError, adding nothing, if any key is unknown"""
+        events = list(events)
+        for _, _, key in events:
+            _check_key(key)
+        touched = set()
+        try:
+            for patient_id, date, key in events:
+                self.patients.setdefault(patient_id, PatientHistory()).add(date, key)
+                touched.add(patient_id)
+        finally:
+            # Even if an event fails part way, the change feed must reflect the events already applied
+            flipped = [patient_id for patient_id in touched if self._reclassify(patient_id, recorded_at)]
+        return flipped
+
+    def status(self, patient_id):
+        """Current scores, entry status and classification of a patient"""
+        return self.patients[patient_id].status()
+
+    def changes_since(self, timestamp: float):
+        """Classification flips recorded strictly after timestamp, oldest first"""
+        return self.changes[bisect.bisect_right(self.changes, timestamp, key=attrgetter('recorded_at')):]
+
+    def _reclassify(self, patient_id, recorded_at: float = None):
+        classified = self.patients[patient_id].status().classified
+        if classified == self.classified.get(patient_id, False):
+            return False
+
+        self.classified[patient_id] = classified
+        change = Change(time.time() if recorded_at is None else recorded_at, patient_id, classified)
+        bisect.insort(self.changes, change, key=attrgetter('recorded_at'))
+        return True
+
+
+def _check_key(key: str):
+    if key not in _CLINICAL_KEYS and key not in _LAB_KEYS:
+        raise KeyError(f'Unknown criterion or entry flag {key!r}')
@@ -8,73 +8,128 @@ Full text: Arthritis Rheumatol . 2023 Oct;75(10):1687-1702.  doi: 10.1002/art.42
 # TODO: Clean up docstrings
 
 import streamlit as st
-from aps_criteria import Criterion, criteria
+import audit
+from instrumentation import metrics
+from aps_criteria import (ENTRY_CLINICAL_CRITERIA, ENTRY_CLINICAL_KEYS, ENTRY_LAB_CRITERIA, ENTRY_LAB_KEYS, Criterion,
+                          criteria, registry)
+from result_cache import result_cache
+from scoring import CLINICAL_THRESHOLD, LAB_THRESHOLD, RESULT_TEXT, meets_entry_masks
+
+# Page labels used by the metrics in instrumentation.py, indexed by session_state.page
+PAGE_NAMES = ('entry', 'vte', 'ate', 'microvascular', 'obstetric', 'cardiac', 'hematology', 'lac', 'apl', 'score')
+
+# Static page content, built once at import and reused by every rerun
+HIDE_STREAMLIT_STYLE = """
+    <style>
+    [data-testid="stToolbar"] {visibility: hidden !important;}
+    footer {visibility: hidden !important;}
+    </style>
+    """
+
+VTE_MAJOR_RISK_FACTORS = """
+    1.  **Active malignancy** with no or noncurative treatment received, ongoing curative treatment including hormonal therapy, or recurrence progression despite curative treatment at the time of the event
+    2.  **Hospital admission** confined to bed (only bathroom privileges) with an acute illness for at least 3 days within 3 months prior to the event
+    3.  **Major trauma** with fractures or spinal cord injury within 1 month prior to the event
+    4.  **Surgery** with general/spinal/epidural anesthesia for >30 minutes within 3 months prior to the event
+    """
 
-ENTRY_CLINICAL_CRITERIA = ['Venous thromboembolism',
-                           'Arterial thromboembolism',
-                           'Microvascular (_e.g._ livedo racemosa, pulmonary hemorrhage, aPL nephropathy, adrenal hemorrhage...)',
-                           'Obstetric morbidity (_e.g._ 3 or more consecutive early fetal losses...)',
-                           'Cardiac valve thickening or vegetation',
-                           'Thrombocytopenia']
+VTE_MINOR_RISK_FACTORS = """
+    1.  **Active systemic autoimmune disease or active inflammatory bowel disease** using disease activity measures guided by current recommendations.
+    2.  **Acute/active severe infection** according to guidelines, e.g., sepsis, pneumonia, SARS-CoV-2
+    3.  **Central venous catheter** in the same vascular bed
+    4.  **Hormone replacement therapy, estrogen containing oral contraceptives, or ongoing in vitro fertilization treatment**
+    5.  **Long distance travel** (≥8 hours)
+    6.  **Obesity** (body mass index [BMI] ≥30 kg/m2)
+    7.  **Pregnancy or postpartum period** within 6 weeks after delivery
+    8.  **Prolonged immobilization** not counted above, e.g., leg injury associated with reduced mobility, or confined to bed out of hospital for at least 3 days.
+    9.  **Surgery** with general/spinal/epidural anesthesia for <30 minutes within 3 months prior to the event
+    """
 
-ENTRY_LAB_CRITERIA = ['Lupus anticoagulant',
-                      'Anti-cardiolipin (IgG or IgM) at moderate-high titre',
-                      'Anti-b2-glycoprotein I (IgG or IgM) at moderate-high titre']
+CVD_HIGH_RISK_FACTORS = """
+    1.  **Arterial hypertension** with systolic blood pressure (BP) ≥180 mm Hg or diastolic BP ≥110 mm Hg
+    2.  **Chronic kidney disease** with estimated glomerular filtration rate ≤60 ml/minute for more than 3 months
+    3.  **Diabetes mellitus** with organ damage or long disease duration (type 1 for ≥20 years; type 2 for ≥10 years)
+    4.  **Hyperlipidemia** (severe) with total cholesterol ≥310 mg/dl (8 mmoles/liter) or low-density lipoprotein (LDL)–cholesterol >190 mg/dl (4.9 mmoles/liter)
+    """
+
+CVD_MODERATE_RISK_FACTORS = """
+    1.  **Arterial hypertension** on treatment, or with persistent systolic BP ≥140 mm Hg or diastolic BP ≥90 mm Hg
+    2.  **Current tobacco smoking**
+    3.  **Diabetes mellitus** with no organ damage and short disease duration (type 1 <20 years; type 2 <10 years)
+    4.  **Hyperlipidemia** (moderate) on treatment, or with total cholesterol above normal range and <310 mg/dl (8 mmoles/liter), or LDL-cholesterol above normal range and <190 mg/dl (4.9 mmoles/liter)
+    5.  **Obesity** (BMI ≥30 kg/m2)
+    """
 
 
 def initialize_app():
+    if metrics.enabled and 'page' not in st.session_state:
+        metrics.inc('aps_sessions')
+
     # Initialize page to start at 0
     st.session_state.setdefault('page', 0)
 
-    # Initialize cache to save initial state of all widgets
-    # As the program runs, session_state.cache will update with the saved state of all widgets
-    st.session_state.setdefault('cache', dict())
+    # Answers are packed into integers so that each session holds a few bytes instead of a dict of widget states:
+    # session_state.answers has one bit per additive criterion (bit positions from aps_criteria.registry) and
+    # session_state.entry one bit per entry criterion (positions in ENTRY_KEYS). Checkboxes are hydrated from them
+    st.session_state.setdefault('answers', 0)
+    st.session_state.setdefault('entry', 0)
 
 
 def meets_entry_criteria():
     """Checks whether entry criteria are met to enter the algorithm, i.e. whether at least one clinical criterion
     and at least one laboratory criterion are checked off by the user"""
-    meets_clinical_criteria = any(st.session_state[f'entry_clinical_{i}'] for i in range(len(ENTRY_CLINICAL_CRITERIA)))
-    meets_lab_criteria = any(st.session_state[f'entry_lab_{i}'] for i in range(len(ENTRY_LAB_CRITERIA)))
-    if meets_clinical_criteria and meets_lab_criteria:
-        return True
-    else:
-        return False
+    return bool(meets_entry_masks(st.session_state.entry))
 
 
-def update_cache(key: str):
-    """Updates session_sate.cache to reflect the current state of each widget; this ensures
+def update_mask(field: str, key: str, bit: int):
+    """Copies the state of checkbox key into bit of session_state[field] (answers or entry); this ensures
     that the state gets preserved when switching between pages in the app"""
-    st.session_state.cache[key] = st.session_state[key]
+    if metrics.enabled:
+        metrics.inc('aps_widget_reruns', page=PAGE_NAMES[st.session_state['page']])
+
+    if st.session_state[key]:
+        st.session_state[field] |= 1 << bit
+    else:
+        st.session_state[field] &= ~(1 << bit)
 
 
+@metrics.timed('aps_scoring_seconds')
 def calculate_scores():
-    """Calculates the clinical and laboratory scores, returns a dictionary of scores representing total score in each
-    domain. Note that only the highest score per domain counts toward the total score"""
+    """Calculates the clinical and laboratory scores, returns a result_cache.CachedResult: the scoring.Assessment
+    (score in each domain, clinical and laboratory totals, classification) and the EMR report text. Note that only
+    the highest score per domain counts toward the total score. Served from the result cache shared by all sessions,
+    so identical answers are scored and rendered once"""
+    return result_cache.get(st.session_state.entry, st.session_state.answers)
 
-    items_selected_per_domain = {n: [0] for n in range(1, 9)}  # each domain starts with score of 0
-    score_per_domain = {n: 0 for n in range(1, 9)}
 
-    for criterion, checked in st.session_state.cache.items():
-        if checked:
-            domain = criteria[criterion].domain
-            points = criteria[criterion].points
-            items_selected_per_domain[domain].append(points)
+@st.cache_resource
+def get_audit_log():
+    """One audit log (and writer thread) per server process, shared by all sessions; None if auditing is off"""
+    return audit.open_from_environment()
 
-    for domain, points in items_selected_per_domain.items():
-        score_per_domain[domain] = max(points)
 
-    return score_per_domain
+def record_assessment(assessment):
+    """Enqueues the assessment in the audit log, once per set of answers: revisiting the score page or rerunning it
+    without changing any criteria does not add another record"""
+    answers = st.session_state.entry, st.session_state.answers
+    audit_log = get_audit_log()
+    if audit_log is None or st.session_state.get('audited') == answers:
+        return
+    audit_log.record(*answers, assessment)
+    st.session_state['audited'] = answers
 
 
-def stateful_checkbox(criterion: Criterion):
-    st.session_state.cache.setdefault(criterion.key, False)
+def packed_checkbox(label: str, key: str, field: str, bit: int):
+    """Checkbox whose value is hydrated from, and saved to, bit of the packed session_state[field]"""
+    return st.checkbox(label,
+                       value=bool(st.session_state[field] >> bit & 1),
+                       key=key,
+                       on_change=update_mask,
+                       args=(field, key, bit))
+
 
-    return st.checkbox(criterion.descriptor,
-                       value=st.session_state.cache[criterion.key],
-                       key=criterion.key,
-                       on_change=update_cache,
-                       kwargs={'key': criterion.key})
+def stateful_checkbox(criterion: Criterion):
+    return packed_checkbox(criterion.descriptor, criterion.key, 'answers', registry.bit_position[criterion.key])
 
 
 def show_next_and_back_buttons(last_page=False, score_page=False):
@@ -112,31 +167,46 @@ def show_next_and_back_buttons(last_page=False, score_page=False):
 
 
 def hide_streamlit_header_footer():
-    hide_streamlit_style = """
-                    <style>
-                    [data-testid="stToolbar"] {visibility: hidden !important;}
-                    footer {visibility: hidden !important;}
-                    </style>
-                    """
-    st.markdown(hide_streamlit_style, unsafe_allow_html=True)
+    st.markdown(HIDE_STREAMLIT_STYLE, unsafe_allow_html=True)
 
 
+@st.fragment
+def show_checkbox_group(criteria_group, caption: str = None):
+    """Checkboxes for a group of criteria, rendered as a fragment: clicking a checkbox only reruns this group
+    instead of the whole page"""
+    for criterion in criteria_group:
+        stateful_checkbox(criterion)
+
+    if caption:
+        st.caption(caption)
+
+
+@metrics.timed('aps_page_render_seconds', counter='aps_reruns', page='entry')
 def show_entry_criteria_page():
     """Page showing entry criteria for algorithm"""
 
-    hide_streamlit_header_footer()
-
     st.write("# Entry criteria ")
+    show_entry_criteria_form()
+
+    # Footer on the first page only
+    st.caption("""ACR/EULAR Antiphospholipid Syndrome Classification Criteria (2023) [Pubmed](https://pubmed.ncbi.nlm.nih.gov/37635643/)  
+                Siraj Mithoowani (2023). View the code on [Github](https://github.com/mithoowani/aps).""")
+
+
+@st.fragment
+def show_entry_criteria_form():
+    """Entry criteria checkboxes and submit button, rendered as a fragment: ticking a box only reruns the form
+    (the button's enabled state depends on the boxes), while submitting reruns the whole app"""
     col1, col2 = st.columns(2)
     with col1:
         st.write('#### At least one clinical criterion')
-        for i, criterion in enumerate(ENTRY_CLINICAL_CRITERIA):
-            st.checkbox(criterion, key=f'entry_clinical_{i}')
+        for bit, (criterion, key) in enumerate(zip(ENTRY_CLINICAL_CRITERIA, ENTRY_CLINICAL_KEYS)):
+            packed_checkbox(criterion, key, 'entry', bit)
 
     with col2:
         st.write('#### Positive aPL test within three years of the clinical criterion')
-        for i, criterion in enumerate(ENTRY_LAB_CRITERIA):
-            st.checkbox(criterion, key=f'entry_lab_{i}')
+        for bit, (criterion, key) in enumerate(zip(ENTRY_LAB_CRITERIA, ENTRY_LAB_KEYS), len(ENTRY_CLINICAL_KEYS)):
+            packed_checkbox(criterion, key, 'entry', bit)
 
     st.caption('Note: Refer to full text or subsequent pages for more details. '
                '_Moderate positive aPL test_ = 40-79 units, _high positive aPL test_ ≥ 80 units.')
@@ -149,199 +219,147 @@ def show_entry_criteria_page():
         st.session_state['page'] += 1
         st.rerun()
 
-    # Footer on the first page only
-    st.caption("""ACR/EULAR Antiphospholipid Syndrome Classification Criteria (2023) [Pubmed](https://pubmed.ncbi.nlm.nih.gov/37635643/)  
-                Siraj Mithoowani (2023). View the code on [Github](https://github.com/mithoowani/aps).""")
-
 
+@metrics.timed('aps_page_render_seconds', counter='aps_reruns', page='vte')
 def show_vte_page():
     """Page showing additive criteria for D1 (venous thromboembolism)"""
 
-    hide_streamlit_header_footer()
-
     st.write("# Additive clinical criteria #")
     st.write('### D1. Macrovascular (Venous thromboembolism) ###')
 
     major_risk_factors_tab, minor_risk_factors_tab = st.tabs(['__Major risk factors__', '__Minor risk factors__'])
     with major_risk_factors_tab:
-        st.markdown("""
-        1.  **Active malignancy** with no or noncurative treatment received, ongoing curative treatment including hormonal therapy, or recurrence progression despite curative treatment at the time of the event
-        2.  **Hospital admission** confined to bed (only bathroom privileges) with an acute illness for at least 3 days within 3 months prior to the event
-        3.  **Major trauma** with fractures or spinal cord injury within 1 month prior to the event
-        4.  **Surgery** with general/spinal/epidural anesthesia for >30 minutes within 3 months prior to the event
-        """)
+        st.markdown(VTE_MAJOR_RISK_FACTORS)
 
     with minor_risk_factors_tab:
-        st.markdown("""
-        1.  **Active systemic autoimmune disease or active inflammatory bowel disease** using disease activity measures guided by current recommendations.
-        2.  **Acute/active severe infection** according to guidelines, e.g., sepsis, pneumonia, SARS-CoV-2
-        3.  **Central venous catheter** in the same vascular bed
-        4.  **Hormone replacement therapy, estrogen containing oral contraceptives, or ongoing in vitro fertilization treatment**
-        5.  **Long distance travel** (≥8 hours)
-        6.  **Obesity** (body mass index [BMI] ≥30 kg/m2)
-        7.  **Pregnancy or postpartum period** within 6 weeks after delivery
-        8.  **Prolonged immobilization** not counted above, e.g., leg injury associated with reduced mobility, or confined to bed out of hospital for at least 3 days.
-        9.  **Surgery** with general/spinal/epidural anesthesia for <30 minutes within 3 months prior to the event
-        """)
+        st.markdown(VTE_MINOR_RISK_FACTORS)
 
     st.markdown('#')
 
     col1, col2 = st.columns(2)
     with col1:
-        stateful_checkbox(criteria['vte_high_risk'])
-        st.caption('One or more _major_ risk factors or two or more _minor_ risk factors at the time of the event')
+        show_checkbox_group([criteria['vte_high_risk']],
+                            caption='One or more _major_ risk factors or two or more _minor_ risk factors at the time of the event')
 
     with col2:
-        stateful_checkbox(criteria['vte_low_risk'])
+        show_checkbox_group([criteria['vte_low_risk']])
 
     show_next_and_back_buttons()
 
 
+@metrics.timed('aps_page_render_seconds', counter='aps_reruns', page='ate')
 def show_ate_page():
     """Page showing additive criteria for D2 (arterial thromboembolism)"""
 
-    hide_streamlit_header_footer()
-
     st.write("# Additive clinical criteria #")
     st.write('### D2. Macrovascular (Arterial thromboembolism) ###')
 
     high_risk_factors_tab, mod_risk_factors_tab = st.tabs(
         ['__High CVD risk factors__', '__Moderate CVD risk factors__'])
     with high_risk_factors_tab:
-        st.markdown("""
-        1.  **Arterial hypertension** with systolic blood pressure (BP) ≥180 mm Hg or diastolic BP ≥110 mm Hg
-        2.  **Chronic kidney disease** with estimated glomerular filtration rate ≤60 ml/minute for more than 3 months
-        3.  **Diabetes mellitus** with organ damage or long disease duration (type 1 for ≥20 years; type 2 for ≥10 years)
-        4.  **Hyperlipidemia** (severe) with total cholesterol ≥310 mg/dl (8 mmoles/liter) or low-density lipoprotein (LDL)–cholesterol >190 mg/dl (4.9 mmoles/liter)
-        """)
+        st.markdown(CVD_HIGH_RISK_FACTORS)
 
     with mod_risk_factors_tab:
-        st.markdown("""
-        1.  **Arterial hypertension** on treatment, or with persistent systolic BP ≥140 mm Hg or diastolic BP ≥90 mm Hg
-        2.  **Current tobacco smoking**
-        3.  **Diabetes mellitus** with no organ damage and short disease duration (type 1 <20 years; type 2 <10 years)
-        4.  **Hyperlipidemia** (moderate) on treatment, or with total cholesterol above normal range and <310 mg/dl (8 mmoles/liter), or LDL-cholesterol above normal range and <190 mg/dl (4.9 mmoles/liter)
-        5.  **Obesity** (BMI ≥30 kg/m2)
-        """)
+        st.markdown(CVD_MODERATE_RISK_FACTORS)
 
     st.markdown('#')
 
     col1, col2 = st.columns(2)
     with col1:
-        stateful_checkbox(criteria['ate_high_risk'])
-        st.caption('One or more _high CVD risk factors_ or 3 or more _moderate CVD risk factors_')
+        show_checkbox_group([criteria['ate_high_risk']],
+                            caption='One or more _high CVD risk factors_ or 3 or more _moderate CVD risk factors_')
 
     with col2:
-        stateful_checkbox(criteria['ate_low_risk'])
+        show_checkbox_group([criteria['ate_low_risk']])
 
     show_next_and_back_buttons()
 
 
+@metrics.timed('aps_page_render_seconds', counter='aps_reruns', page='microvascular')
 def show_microvascular_page():
     """Page showing additive criteria for D3 (microvascular)"""
 
-    hide_streamlit_header_footer()
-
-    suspected_microvascular_criteria = [criterion for criterion in criteria.values() if (criterion.domain == 3 and
-                                                                                         criterion.points == 2)]
-
-    established_microvascular_criteria = [criterion for criterion in criteria.values() if (criterion.domain == 3 and
-                                                                                           criterion.points == 5)]
+    suspected_microvascular_criteria = [criterion for criterion in registry.by_domain[3] if criterion.points == 2]
+    established_microvascular_criteria = [criterion for criterion in registry.by_domain[3] if criterion.points == 5]
 
     st.write("# Additive clinical criteria #")
     st.write('### D3. Microvascular ###')
     col1, col2 = st.columns(2)
     with col1:
         st.write('##### *Suspected* (one or more of the following): 2 points')
-        for key in suspected_microvascular_criteria:
-            stateful_checkbox(key)
+        show_checkbox_group(suspected_microvascular_criteria)
 
     with col2:
         st.write('##### *Established* (one or more of the following): 5 points')
-        for key in established_microvascular_criteria:
-            stateful_checkbox(key)
+        show_checkbox_group(established_microvascular_criteria)
 
     show_next_and_back_buttons()
 
 
+@metrics.timed('aps_page_render_seconds', counter='aps_reruns', page='obstetric')
 def show_obstetric_page():
     """Page showing additive criteria for D4 (obstetric)"""
 
-    hide_streamlit_header_footer()
-
-    obstetric_criteria = [criterion for criterion in criteria.values() if criterion.domain == 4]
-    obstetric_criteria.sort(key=lambda x: x.points)
+    obstetric_criteria = registry.by_domain[4]
 
     st.write("# Additive clinical criteria #")
     st.write('### D4. Obstetric ###')
-    for key in obstetric_criteria:
-        stateful_checkbox(key)
+    show_checkbox_group(obstetric_criteria)
 
     show_next_and_back_buttons()
 
 
+@metrics.timed('aps_page_render_seconds', counter='aps_reruns', page='cardiac')
 def show_cardiac_page():
     """Page showing additive criteria for D5 (cardiac valve)"""
 
-    hide_streamlit_header_footer()
-
-    cardiac_criteria = [criterion for criterion in criteria.values() if criterion.domain == 5]
-    cardiac_criteria.sort(key=lambda x: x.points)
+    cardiac_criteria = registry.by_domain[5]
 
     st.write("# Additive clinical criteria #")
     st.write('### D5. Cardiac valve ###')
-    for key in cardiac_criteria:
-        stateful_checkbox(key)
+    show_checkbox_group(cardiac_criteria)
 
     show_next_and_back_buttons()
 
 
+@metrics.timed('aps_page_render_seconds', counter='aps_reruns', page='hematology')
 def show_hematology_page():
     """Page showing additive criteria for D6 (hematology)"""
 
-    hide_streamlit_header_footer()
-
-    heme_criteria = [criterion for criterion in criteria.values() if criterion.domain == 6]
+    heme_criteria = registry.by_domain[6]
 
     st.write("# Additive clinical criteria #")
     st.write('### D6. Hematology ###')
-    for key in heme_criteria:
-        stateful_checkbox(key)
+    show_checkbox_group(heme_criteria)
 
     show_next_and_back_buttons()
 
 
+@metrics.timed('aps_page_render_seconds', counter='aps_reruns', page='lac')
 def show_lac_page():
     """Page showing additive criteria for D7 (lupus anticoagulant)"""
 
-    hide_streamlit_header_footer()
-
-    lac_criteria = [criterion for criterion in criteria.values() if criterion.domain == 7]
-    lac_criteria.sort(key=lambda x: x.points)
+    lac_criteria = registry.by_domain[7]
 
     st.write("# Additive laboratory criteria #")
     st.write('### D7. aPL test by coagulation-based functional assay (lupus anticoagulant test [LAC]) ###')
-    for key in lac_criteria:
-        stateful_checkbox(key)
+    show_checkbox_group(lac_criteria)
 
     st.caption('Note: Refer to full text for accepted laboratory procedures.')
 
     show_next_and_back_buttons()
 
 
+@metrics.timed('aps_page_render_seconds', counter='aps_reruns', page='apl')
 def show_apl_page():
     """Page showing additive criteria for D8 (aPL tests)"""
 
-    hide_streamlit_header_footer()
-
-    apl_criteria = [criterion for criterion in criteria.values() if criterion.domain == 8]
-    apl_criteria.sort(key=lambda x: x.points)
+    apl_criteria = registry.by_domain[8]
 
     st.write("# Additive laboratory criteria #")
     st.write('### D8. aPL test by solid phase assay (anti-cardiolipin antibody [aCL] ELISA and/or '
              'anti-β2-glycoprotein-I antibody [aβ2GPI] ELISA [persistent]) ###')
-    for key in apl_criteria:
-        stateful_checkbox(key)
+    show_checkbox_group(apl_criteria)
 
     st.caption('Note: _Moderate positive aPL test_ = 40-79 units, _high positive aPL test_ ≥ 80 units. Refer to full '
                'text for accepted laboratory procedures.')
@@ -349,43 +367,20 @@ def show_apl_page():
     show_next_and_back_buttons(last_page=True)
 
 
+@metrics.timed('aps_page_render_seconds', counter='aps_reruns', page='score')
 def show_score():
     """Page showing the final scoring criteria"""
 
-    hide_streamlit_header_footer()
-
-    scores = calculate_scores()
-    total_clinical_score = sum(scores[i] for i in range(1, 7))
-    total_lab_score = sum(scores[i] for i in range(7, 9))
-
-    score_text = f"""
-    Domain                                  Score
-    D1: Venous thromboembolism              {scores[1]}              
-    D2: Arterial thromboembolism            {scores[2]} 
-    D3: Microvascular                       {scores[3]} 
-    D4: Obstetric                           {scores[4]} 
-    D5: Cardiac Valve                       {scores[5]} 
-    D6: Hematology                          {scores[6]}     
-    --------------------------------------------------
-    Total Clinical                          {total_clinical_score}
-    
-    D7: Laboratory (lupus anticoagulant)    {scores[7]} 
-    D8: Laboratory (aPL serology)           {scores[8]} 
-    --------------------------------------------------
-    Total Lab                               {total_lab_score}
-    """
+    assessment, score_text = calculate_scores()
+    record_assessment(assessment)
 
     st.write("# Total score #")
-    st.write('_Classified as APS for research purposes if there are at least 3 points '
-             'from clinical domains **AND** at least 3 points from laboratory domains_')
+    st.write(f'_Classified as APS for research purposes if there are at least {CLINICAL_THRESHOLD} points '
+             f'from clinical domains **AND** at least {LAB_THRESHOLD} points from laboratory domains_')
 
     st.markdown('#####')
 
-    if total_clinical_score >= 3 and total_lab_score >= 3:
-        st.write('##### Result: Classified as APS for research purposes')
-
-    else:
-        st.write('##### Result: Does not meet APS classification criteria')
+    st.write(f'##### Result: {RESULT_TEXT[assessment.classified]}')
 
     st.code(score_text)  # This displays nicely for EMR copy/paste
     st.caption('Copy and paste into your EMR')
@@ -395,8 +390,10 @@ def show_score():
     show_next_and_back_buttons(score_page=True)
 
 
-if __name__ == '__main__':
+@metrics.timed('aps_rerun_seconds')
+def run_app():
     initialize_app()
+    hide_streamlit_header_footer()
 
     match st.session_state['page']:
         case 0:
@@ -428,3 +425,7 @@ if __name__ == '__main__':
 
         case 9:
             show_score()
+
+
+if __name__ == '__main__':
+    run_app()
@@ -0,0 +1,158 @@
+"""
+Per-page rerun timings of the web app on a real `streamlit run` server.
+
+Drives one or more simulated clinicians over Streamlit's websocket protocol, the way the browser does: each session
+ticks random checkboxes on every page (a fragment rerun where the checkbox group is an st.fragment, a full script run
+otherwise) and clicks Next through to the score page. Each interaction is timed at the client, over loopback, from
+sending the BackMsg to receiving the script_finished message of the last run it triggered (Next reruns the app twice:
+the click and the st.rerun() it calls), and on the server by summing the execution times Streamlit reports in the
+page profile message of each run. The round trip includes Streamlit's message batching and thread handoffs, which
+dominate it, so compare the server-side times. Reports the median per page of loading the page and of a checkbox
+click.
+
+Needs the websockets package (requirements-dev.txt) and was written against the Streamlit version pinned in
+requirements.txt, whose websocket protocol it speaks. Start the app first; page profiles are only sent with
+browser.gatherUsageStats on (the harness does not forward them anywhere), and APS_AUDIT_DB= keeps the simulated
+sessions out of the audit log:
+    APS_AUDIT_DB= streamlit run main.py --server.port 8599 --server.headless true
+        --server.enableXsrfProtection false --browser.gatherUsageStats true
+then: python rerun_timings.py --port 8599 --sessions 30
+"""
+
+import argparse
+import random
+import statistics
+import time
+from collections import defaultdict, namedtuple
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from websockets.sync.client import connect
+
+N_PAGES = 10
+PAGE_NAMES = ('entry', 'vte', 'ate', 'microvascular', 'obstetric', 'cardiac', 'hematology', 'lac', 'apl', 'score')
+NEXT_LABELS = ('Apply additive criteria', 'Next', 'Calculate score')
+
+Timing = namedtuple('Timing', ['round_trip', 'server'])
+
+
+class Session:
+    """One browser tab: the widgets of the last run and their values, sent back with every rerun request"""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.widgets = {}  # widget id -> (element type, label, fragment id, default value)
+        self.values = {}  # checkbox id -> bool
+
+    def rerun(self, trigger: str = None, fragment_id: str = ''):
+        """Requests a rerun (of fragment_id only, if given, or of the fragment holding the trigger button) and waits
+        for it to finish. Returns Timing: the round trip and the server-side execution time summed over the runs (None
+        unless the server sends page profiles)"""
+        message = BackMsg()
+        state = message.rerun_script
+        state.fragment_id = self.widgets[trigger][2] if trigger else fragment_id
+        for widget_id, value in self.values.items():
+            widget = state.widget_states.widgets.add(id=widget_id)
+            widget.bool_value = value
+        if trigger:
+            state.widget_states.widgets.add(id=trigger, trigger_value=True)
+
+        start = time.perf_counter()
+        self.websocket.send(message.SerializeToString())
+        server = None
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(self.websocket.recv(timeout=60))
+            kind = forward.WhichOneof('type')
+            if kind == 'new_session' and not forward.new_session.fragment_ids_this_run:
+                # A full run replaces every widget; a fragment run only redraws the fragment's own
+                self.widgets.clear()
+            elif kind == 'delta':
+                self._collect(forward.delta)
+            elif kind == 'page_profile':
+                server = (server or 0) + forward.page_profile.exec_time / 1e6
+            elif kind == 'script_finished':
+                status = ForwardMsg.ScriptFinishedStatus.Name(forward.script_finished)
+                if status == 'FINISHED_WITH_COMPILE_ERROR':
+                    raise RuntimeError('Script failed to compile')
+                if status != 'FINISHED_EARLY_FOR_RERUN':
+                    elapsed = time.perf_counter() - start
+                    self.values = {widget_id: self.values.get(widget_id, default)
+                                   for widget_id, (kind, _, _, default) in self.widgets.items() if kind == 'checkbox'}
+                    return Timing(elapsed, server)
+
+    def _collect(self, delta):
+        if delta.WhichOneof('type') != 'new_element':
+            return
+        element = delta.new_element
+        kind = element.WhichOneof('type')
+        if kind == 'exception':
+            raise RuntimeError(f'App raised {element.exception.type}: {element.exception.message}')
+        if kind == 'checkbox':
+            self.widgets[element.checkbox.id] = ('checkbox', element.checkbox.label, delta.fragment_id,
+                                                 element.checkbox.default)
+        elif kind == 'button':
+            self.widgets[element.button.id] = ('button', element.button.label, delta.fragment_id, False)
+
+    def checkboxes(self):
+        return [(widget_id, fragment_id) for widget_id, (kind, _, fragment_id, _) in self.widgets.items()
+                if kind == 'checkbox']
+
+    def button(self, labels):
+        return next(widget_id for widget_id, (kind, label, _, _) in self.widgets.items()
+                    if kind == 'button' and label in labels)
+
+
+def run_session(url: str, rng: random.Random, page_loads: dict, clicks: dict, probability: float):
+    """Clicks through every page of one session, appending timings to page_loads and clicks by page name"""
+    with connect(url, subprotocols=['streamlit'], max_size=None) as websocket:
+        session = Session(websocket)
+        page_loads[PAGE_NAMES[0]].append(session.rerun())
+        for page in range(N_PAGES - 1):
+            checkboxes = session.checkboxes()
+            if page == 0:
+                # Entry page: at least one clinical and one lab criterion so that the additive pages are reachable
+                chosen = [checkbox for checkbox in checkboxes if 'entry_clinical_0' in checkbox[0] or
+                          'entry_lab_0' in checkbox[0]]
+            else:
+                chosen = [checkbox for checkbox in checkboxes if rng.random() < probability] or checkboxes[:1]
+            for widget_id, fragment_id in chosen:
+                session.values[widget_id] = True
+                clicks[PAGE_NAMES[page]].append(session.rerun(fragment_id=fragment_id))
+            page_loads[PAGE_NAMES[page + 1]].append(session.rerun(trigger=session.button(NEXT_LABELS)))
+        if not any(kind == 'button' and label == 'Back' for kind, label, _, _ in session.widgets.values()):
+            raise RuntimeError('Session did not reach the score page')
+
+
+def _medians(timings: list):
+    if not timings:
+        return '-'
+    server = [timing.server for timing in timings if timing.server is not None]
+    server = f'{statistics.median(server) * 1000:.1f}' if server else '-'
+    return f'{server} / {statistics.median(timing.round_trip for timing in timings) * 1000:.1f}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time page loads and checkbox reruns on a running APS web app')
+    parser.add_argument('--port', type=int, default=8501)
+    parser.add_argument('--sessions', type=int, default=30, help='Number of sessions, run one after the other')
+    parser.add_argument('--probability', type=float, default=0.3, help='Chance of ticking each checkbox')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    url = f'ws://localhost:{args.port}/_stcore/stream'
+    rng = random.Random(args.seed)
+    run_session(url, rng, defaultdict(list), defaultdict(list), args.probability)  # warm-up
+
+    page_loads, clicks = defaultdict(list), defaultdict(list)
+    for _ in range(args.sessions):
+        run_session(url, rng, page_loads, clicks, args.probability)
+
+    print('Median milliseconds per interaction: server-side execution (from page profiles) / round trip')
+    print(f'{"page":<16}{"load":>18}{"checkbox click":>18}{"clicks":>8}')
+    for page in PAGE_NAMES:
+        print(f'{page:<16}{_medians(page_loads[page]):>18}{_medians(clicks[page]):>18}{len(clicks[page]):8d}')
+
+
+if __name__ == '__main__':
+    main()
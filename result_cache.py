@@ -0,0 +1,111 @@
+"""
+Process-wide LRU cache of assessments and their EMR reports, keyed by answer set.
+
+The key is the canonical encoding of one patient's answers as a single integer: the entry bitmask (bit positions from
+aps_criteria.ENTRY_KEYS) shifted above the 26-bit answer bitmask (bit positions from aps_criteria.registry), exactly
+the session_state.entry and session_state.answers of the web app. Every Streamlit session runs in the same process, so
+sessions submitting the same answers share one entry; the scoring service looks up the unique answer sets of each
+batch and computes only the missing ones, vectorized. Bulk exports of a whole cohort bypass the cache (see
+export_reports.py).
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from scoring import CRITERIA_KEYS, assessments, format_reports, meets_entry_masks, score_masks
+
+ANSWER_BITS = len(CRITERIA_KEYS)
+
+CachedResult = namedtuple('CachedResult', ['assessment', 'report'])
+
+
+def cache_key(entry: int, answers: int):
+    return entry << ANSWER_BITS | answers
+
+
+class ResultCache:
+    """Bounded LRU mapping of cache_key(entry, answers) -> CachedResult, safe to share between threads"""
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, entry: int, answers: int):
+        """CachedResult of one patient's entry and answer bitmasks, computed on a miss"""
+        key = cache_key(entry, answers)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+
+        # Computed outside the lock; two sessions missing on the same key at once both compute the same result
+        result, = compute_results(np.array([key], dtype=np.uint64))
+        self._put({key: result}, misses=1)
+        return result
+
+    def get_many(self, entries, answers):
+        """CachedResults of arrays of entry and answer bitmasks (e.g. from scoring.encode_entry_matrix and
+        encode_matrix), one per row. Each unique answer set is looked up once and all misses are scored together"""
+        keys = np.asarray(entries, dtype=np.uint64) << np.uint64(ANSWER_BITS) | np.asarray(answers, dtype=np.uint64)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        unique = unique.tolist()
+
+        found = {}
+        with self._lock:
+            for key in unique:
+                result = self._entries.get(key)
+                if result is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = result
+            self.hits += len(found)
+
+        missing = [key for key in unique if key not in found]
+        if missing:
+            computed = dict(zip(missing, compute_results(np.array(missing, dtype=np.uint64))))
+            # A batch with more new answer sets than the cache holds would evict its own entries, so only keep the last
+            self._put({key: computed[key] for key in missing[-self.max_entries:]}, misses=len(missing))
+            found.update(computed)
+        return [found[unique[index]] for index in inverse.ravel().tolist()]
+
+    def _put(self, results: dict, misses: int):
+        with self._lock:
+            self.misses += misses
+            self._entries.update(results)
+            for key in results:
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """Hit/miss counts (one lookup per unique answer set) and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_rate': self.hits / lookups if lookups else 0.0, 'size': len(self._entries),
+                    'max_entries': self.max_entries}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+def compute_results(keys):
+    """CachedResults for an array of cache keys, scored and rendered in one vectorized pass"""
+    scores = score_masks(keys & np.uint64((1 << ANSWER_BITS) - 1))
+    meets_entry = meets_entry_masks(keys >> np.uint64(ANSWER_BITS))
+    return list(map(CachedResult, assessments(scores, meets_entry),
+                    format_reports(scores.domains, scores.clinical, scores.lab)))
+
+
+# Shared by every session of the web app and every batch in this process
+result_cache = ResultCache()
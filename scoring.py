@@ -0,0 +1,168 @@
+"""
+Vectorized scoring engine for the 2023 ACR/EULAR APS classification criteria.
+Scores any number of patients at once from an (n_patients x n_criteria) boolean matrix, independent of Streamlit.
+
+Together with aps_criteria.py this is the core that batch workers, the scoring service and the web app share: it
+imports nothing beyond the standard library and NumPy, so worker processes start without Streamlit's import cost
+(checked by the import suite in benchmark.py).
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from aps_criteria import ENTRY_CLINICAL_KEYS, ENTRY_KEYS, criteria_set, registry
+from evaluators import compile_evaluator
+
+EVALUATOR = compile_evaluator(criteria_set)
+
+DOMAINS = EVALUATOR.domains
+CLINICAL_DOMAINS = DOMAINS[:EVALUATOR.n_clinical_domains]
+LAB_DOMAINS = DOMAINS[EVALUATOR.n_clinical_domains:]
+CLINICAL_THRESHOLD = EVALUATOR.clinical_threshold
+LAB_THRESHOLD = EVALUATOR.lab_threshold
+ENTRY_CLINICAL_MASK = (1 << len(ENTRY_CLINICAL_KEYS)) - 1
+ENTRY_LAB_MASK = (1 << len(ENTRY_KEYS)) - 1 & ~ENTRY_CLINICAL_MASK
+
+# Column order of the answer matrix is the registry bit order: criteria grouped by domain (then by points), so that
+# each domain is a contiguous block of columns and per-domain maxima reduce to a single np.maximum.reduceat call
+CRITERIA_KEYS = EVALUATOR.keys
+POINTS = EVALUATOR.points
+DOMAIN_STARTS = EVALUATOR.domain_starts
+
+Scores = namedtuple('Scores', ['domains', 'clinical', 'lab', 'classified'])
+Assessment = namedtuple('Assessment', ['scores', 'clinical', 'lab', 'meets_entry', 'classified'])
+
+
+def _domain_table(domain: int):
+    """Max points for every subset of the domain's criteria, indexed by the domain's slice of the answer bitmask"""
+    points = registry.domain_points[domain]
+    table = np.zeros(1 << len(points), dtype=np.int8)
+    for subset in range(1, len(table)):
+        table[subset] = points[subset.bit_length() - 1]  # criteria within a domain are ordered by points
+    return table
+
+
+# Lookup tables: every domain's subset -> max points table concatenated into one flat array, so scoring a batch of
+# bitmasks is a single fancy-indexing operation; CLASSIFICATION_TABLE is indexed by (clinical total, lab total)
+_DOMAIN_TABLES = [_domain_table(domain) for domain in DOMAINS]
+DOMAIN_TABLE = np.concatenate(_DOMAIN_TABLES)
+DOMAIN_TABLE_OFFSETS = np.cumsum([0] + [len(table) for table in _DOMAIN_TABLES[:-1]])
+DOMAIN_SHIFTS = np.array([registry.domain_shift[domain] for domain in DOMAINS], dtype=np.uint64)
+DOMAIN_WIDTH_MASKS = np.array([(1 << registry.domain_width[domain]) - 1 for domain in DOMAINS], dtype=np.uint64)
+BIT_WEIGHTS = np.left_shift(np.uint64(1), np.arange(len(CRITERIA_KEYS), dtype=np.uint64))
+
+_MAX_CLINICAL = sum(max(registry.domain_points[domain]) for domain in CLINICAL_DOMAINS)
+_MAX_LAB = sum(max(registry.domain_points[domain]) for domain in LAB_DOMAINS)
+CLASSIFICATION_TABLE = np.logical_and.outer(np.arange(_MAX_CLINICAL + 1) >= CLINICAL_THRESHOLD,
+                                            np.arange(_MAX_LAB + 1) >= LAB_THRESHOLD)
+
+
+def _report_template():
+    """One line per domain, labelled with its name in the criteria set, then the clinical and laboratory totals"""
+    def section(domains, total: str, field: str):
+        return [f'D{domain}: {criteria_set.domain_names[domain]}'.ljust(40) + f'{{d{domain}}}' for domain in domains] \
+            + ['-' * 50, total.ljust(40) + f'{{{field}}}']
+
+    lines = ['Domain'.ljust(40) + 'Score', *section(CLINICAL_DOMAINS, 'Total Clinical', 'clinical'), '',
+             *section(LAB_DOMAINS, 'Total Lab', 'lab')]
+    return ''.join(f'\n    {line}' for line in lines) + '\n    '
+
+
+# Fixed-width EMR text shown by show_score() in main.py, shared by every path that renders a report
+REPORT_TEMPLATE = _report_template()
+
+RESULT_TEXT = {True: 'Classified as APS for research purposes',
+               False: 'Does not meet APS classification criteria'}
+
+# REPORT_TEMPLATE with positional %d fields, for rendering many reports without a str.format call per field;
+# REPORT_FIELDS lists the fields in the order they appear in the text
+REPORT_FIELDS = tuple(f'd{domain}' for domain in CLINICAL_DOMAINS) + ('clinical',) + \
+    tuple(f'd{domain}' for domain in LAB_DOMAINS) + ('lab',)
+REPORT_FORMAT = REPORT_TEMPLATE.replace('%', '%%').format(**dict.fromkeys(REPORT_FIELDS, '%d'))
+
+
+def score_matrix(matrix):
+    """Scores a boolean answer matrix whose columns follow CRITERIA_KEYS. Returns Scores with:
+    domains: (n, len(DOMAINS)) array of the highest score in each domain (only the highest score per domain counts)
+    clinical, lab: (n,) arrays of total clinical (CLINICAL_DOMAINS) and laboratory (LAB_DOMAINS) scores
+    classified: (n,) boolean array, True if at least CLINICAL_THRESHOLD clinical AND LAB_THRESHOLD laboratory points"""
+    matrix = np.asarray(matrix, dtype=bool)
+    if matrix.ndim != 2 or matrix.shape[1] != len(CRITERIA_KEYS):
+        raise ValueError(f'Expected an (n_patients, {len(CRITERIA_KEYS)}) answer matrix, got shape {matrix.shape}')
+
+    points = np.where(matrix, POINTS, np.int8(0))
+    domains = np.maximum.reduceat(points, DOMAIN_STARTS, axis=1)
+
+    clinical = domains[:, :len(CLINICAL_DOMAINS)].sum(axis=1, dtype=np.int16)
+    lab = domains[:, len(CLINICAL_DOMAINS):].sum(axis=1, dtype=np.int16)
+    classified = (clinical >= CLINICAL_THRESHOLD) & (lab >= LAB_THRESHOLD)
+
+    return Scores(domains=domains, clinical=clinical, lab=lab, classified=classified)
+
+
+def encode_matrix(matrix):
+    """Encodes each row of a boolean answer matrix (columns follow CRITERIA_KEYS) as a uint64 answer bitmask,
+    using the same bit positions as aps_criteria.encode_answers"""
+    matrix = np.asarray(matrix, dtype=bool)
+    if matrix.ndim != 2 or matrix.shape[1] != len(CRITERIA_KEYS):
+        raise ValueError(f'Expected an (n_patients, {len(CRITERIA_KEYS)}) answer matrix, got shape {matrix.shape}')
+    packed = np.zeros((len(matrix), 8), dtype=np.uint8)
+    packed[:, :(matrix.shape[1] + 7) // 8] = np.packbits(matrix, axis=1, bitorder='little')
+    return packed.view('<u8').ravel().astype(np.uint64, copy=False)
+
+
+def encode_entry_matrix(flags):
+    """Encodes each row of an (n, 9) boolean entry criteria matrix (columns follow aps_criteria.ENTRY_KEYS) as an
+    entry bitmask, the batch equivalent of session_state.entry"""
+    flags = np.asarray(flags, dtype=bool)
+    if flags.ndim != 2 or flags.shape[1] != len(ENTRY_KEYS):
+        raise ValueError(f'Expected an (n_patients, {len(ENTRY_KEYS)}) entry matrix, got shape {flags.shape}')
+    return flags.astype(np.uint16) @ (np.uint16(1) << np.arange(len(ENTRY_KEYS), dtype=np.uint16))
+
+
+def score_masks(masks):
+    """Lookup-table equivalent of score_matrix for an array of answer bitmasks (see encode_matrix). Each domain's
+    slice of the bitmask indexes DOMAIN_TABLE directly and the totals index CLASSIFICATION_TABLE"""
+    masks = np.asarray(masks, dtype=np.uint64).reshape(-1, 1)
+    subsets = (masks >> DOMAIN_SHIFTS) & DOMAIN_WIDTH_MASKS
+    domains = DOMAIN_TABLE[subsets.astype(np.intp) + DOMAIN_TABLE_OFFSETS]
+
+    clinical = domains[:, :len(CLINICAL_DOMAINS)].sum(axis=1, dtype=np.int16)
+    lab = domains[:, len(CLINICAL_DOMAINS):].sum(axis=1, dtype=np.int16)
+    classified = CLASSIFICATION_TABLE[clinical, lab]
+
+    return Scores(domains=domains, clinical=clinical, lab=lab, classified=classified)
+
+
+def meets_entry_masks(masks):
+    """Entry criteria check on entry bitmasks (bit positions from aps_criteria.ENTRY_KEYS, see encode_entry_matrix):
+    True for each patient with at least one clinical AND at least one laboratory entry criterion. The only
+    implementation of the check: the web app passes its single session_state.entry"""
+    masks = np.asarray(masks)
+    return ((masks & ENTRY_CLINICAL_MASK) != 0) & ((masks & ENTRY_LAB_MASK) != 0)
+
+
+def assessments(scores: Scores, meets_entry):
+    """One Assessment per patient from the Scores of score_masks or score_matrix and an (n,) boolean array of entry
+    criteria results; classified requires the entry criteria as well as both totals at their thresholds"""
+    meets_entry = np.asarray(meets_entry, dtype=bool)
+    return [Assessment(dict(zip(DOMAINS, domains)), clinical, lab, entry, classified)
+            for domains, clinical, lab, entry, classified in zip(scores.domains.tolist(), scores.clinical.tolist(),
+                                                                  scores.lab.tolist(), meets_entry.tolist(),
+                                                                  (meets_entry & scores.classified).tolist())]
+
+
+def assess(answers: int, meets_entry: bool):
+    """Full single-patient result from an answer bitmask: {domain: score}, clinical and laboratory totals, and the
+    classification. Runs through score_masks, the same code as every batch path"""
+    return assessments(score_masks([answers]), [meets_entry])[0]
+
+
+def format_reports(domains, clinical, lab):
+    """Renders an (n, len(DOMAINS)) domain score array and the (n,) clinical and lab totals (e.g. from score_matrix) as
+    a list of n EMR text blocks in the layout of REPORT_TEMPLATE"""
+    names = [f'd{domain}' for domain in DOMAINS] + ['clinical', 'lab']
+    table = np.column_stack([domains, clinical, lab])
+    values = table[:, [names.index(field) for field in REPORT_FIELDS]].tolist()
+    return [REPORT_FORMAT % tuple(row) for row in values]
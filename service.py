@@ -0,0 +1,227 @@
+"""
+Async HTTP scoring service for EMR integration, built on the same criteria and scoring engine as the web app.
+Standard library only (asyncio); several worker processes can share one port via SO_REUSEPORT.
+
+A patient is a JSON object of flags named like the app's widgets, e.g.
+    {"entry_clinical_0": true, "entry_lab_0": true, "vte_low_risk": true, "persistent_lac": true}
+Omitted flags count as unchecked.
+
+Endpoints:
+    POST /score         one patient -> one result
+    POST /score/batch   {"patients": [patient, ...]} -> {"results": [result, ...]}
+    GET  /health
+
+A result holds the per-domain scores, clinical/lab totals, whether the entry criteria are met, the classification
+and the same EMR text block shown by show_score().
+
+Usage: python service.py --port 8000 --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+
+from aps_criteria import ENTRY_CLINICAL_KEYS, ENTRY_LAB_KEYS
+from result_cache import result_cache
+from scoring import CRITERIA_KEYS, RESULT_TEXT, encode_entry_matrix, encode_matrix
+
+FLAG_KEYS = ENTRY_CLINICAL_KEYS + ENTRY_LAB_KEYS + CRITERIA_KEYS
+FLAG_COLUMN = {key: column for column, key in enumerate(FLAG_KEYS)}
+MAX_BODY_BYTES = 64 * 1024 * 1024
+MAX_LINE_BYTES = 64 * 1024  # request line and each header line; the StreamReader buffer limit
+MAX_HEADER_LINES = 100
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           414: 'URI Too Long', 431: 'Request Header Fields Too Large', 500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def patients_to_matrix(patients: list):
+    """Converts a list of patient objects to an (n, len(FLAG_KEYS)) boolean matrix, rejecting unknown flags"""
+    matrix = np.zeros((len(patients), len(FLAG_KEYS)), dtype=bool)
+    for row, patient in enumerate(patients):
+        if not isinstance(patient, dict):
+            raise RequestError(400, f'Patient {row} must be a JSON object')
+        for key, checked in patient.items():
+            if key not in FLAG_COLUMN:
+                raise RequestError(400, f'Patient {row} has unknown flag {key!r}')
+            if not isinstance(checked, bool):
+                raise RequestError(400, f'Patient {row} flag {key!r} must be true or false')
+            matrix[row, FLAG_COLUMN[key]] = checked
+    return matrix
+
+
+def score_patients(patients: list):
+    """Scores a list of patient objects; returns a list of JSON-serializable results. Answer sets seen before (by
+    this worker) are served from the shared result cache"""
+    matrix = patients_to_matrix(patients)
+    n_entry = len(ENTRY_CLINICAL_KEYS) + len(ENTRY_LAB_KEYS)
+    cached = result_cache.get_many(encode_entry_matrix(matrix[:, :n_entry]), encode_matrix(matrix[:, n_entry:]))
+
+    results = []
+    for assessment, report in cached:
+        results.append({'domains': {f'D{domain}': score for domain, score in assessment.scores.items()},
+                        'clinical': assessment.clinical,
+                        'lab': assessment.lab,
+                        'meets_entry': assessment.meets_entry,
+                        'classified': assessment.classified,
+                        'result': RESULT_TEXT[assessment.classified],
+                        'report': report})
+    return results
+
+
+def route(method: str, path: str, body: bytes):
+    """Dispatches a request; returns (status, JSON-serializable payload)"""
+    if path == '/health':
+        return 200, {'status': 'ok'}
+    if path not in ('/score', '/score/batch'):
+        raise RequestError(404, f'No endpoint at {path}')
+    if method != 'POST':
+        raise RequestError(405, f'{path} only accepts POST')
+
+    try:
+        payload = json.loads(body)
+    except ValueError as e:
+        raise RequestError(400, f'Invalid JSON: {e}') from None
+
+    if path == '/score':
+        return 200, score_patients([payload])[0]
+
+    if not isinstance(payload, dict) or not isinstance(payload.get('patients'), list):
+        raise RequestError(400, 'Expected {"patients": [...]}')
+    return 200, {'results': score_patients(payload['patients'])}
+
+
+def route_or_error(method: str, path: str, body: bytes):
+    """route(), with any unexpected exception logged and answered as a 500 rather than left to drop the connection"""
+    try:
+        return route(method, path, body)
+    except RequestError:
+        raise
+    except Exception:
+        logging.getLogger(__name__).exception('Unhandled error serving %s %s', method, path)
+        return 500, {'error': 'Internal server error'}
+
+
+async def read_line(reader: asyncio.StreamReader, status: int):
+    """Reads one line of the request head, raising RequestError(status) if it exceeds the reader's buffer limit"""
+    try:
+        return await reader.readline()
+    except ValueError:  # asyncio's LimitOverrunError, re-raised by readline as ValueError
+        raise RequestError(status, f'Line exceeds {MAX_LINE_BYTES} bytes') from None
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """Reads one HTTP/1.1 request; returns (method, path, headers, body), or None if the client closed the connection"""
+    request_line = await read_line(reader, 414)
+    if not request_line:
+        return None
+    try:
+        method, path, _ = request_line.decode('latin-1').split()
+    except ValueError:
+        raise RequestError(400, 'Malformed request line') from None
+
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await read_line(reader, 431)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise RequestError(400, 'Too many headers')
+
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise RequestError(400, 'Invalid Content-Length') from None
+    if length < 0:
+        raise RequestError(400, 'Invalid Content-Length')
+    if length > MAX_BODY_BYTES:
+        raise RequestError(413, f'Request body exceeds {MAX_BODY_BYTES} bytes')
+    body = await reader.readexactly(length) if length else b''
+    return method, path.split('?', 1)[0], headers, body
+
+
+def write_response(writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool):
+    body = json.dumps(payload).encode()
+    writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                 f'Content-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\n'
+                 f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + body)
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Serves requests on one connection until the client closes it (HTTP/1.1 keep-alive)"""
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                status, payload = route_or_error(method, path, body)
+            except RequestError as e:
+                keep_alive = False
+                status, payload = e.status, {'error': str(e)}
+
+            write_response(writer, status, payload, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int):
+    server = await asyncio.start_server(handle_connection, host, port, reuse_port=True, limit=MAX_LINE_BYTES)
+    async with server:
+        await server.serve_forever()
+
+
+def run_worker(host: str, port: int):
+    try:
+        asyncio.run(serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='HTTP service for APS classification')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+    args = parser.parse_args(argv)
+
+    print(f'Serving on http://{args.host}:{args.port} with {args.workers} worker(s)')
+    if args.workers == 1:
+        run_worker(args.host, args.port)
+        return
+
+    # Each worker binds its own socket with SO_REUSEPORT, so the kernel balances connections across processes
+    workers = [multiprocessing.Process(target=run_worker, args=(args.host, args.port)) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+import sqlite3
+
+import pytest
+
+import audit
+from scoring import assess
+
+
+def test_records_are_committed_on_close(tmp_path):
+    path = str(tmp_path / 'audit.sqlite3')
+    log = audit.AuditLog(path, flush_interval=0.01)
+    for answers in (0, 0b11, 0b11):
+        log.record(0b11, answers, assess(answers, True))
+    log.close()
+    with pytest.raises(RuntimeError):
+        log.record(0, 0, assess(0, False))
+    assert audit.counts_by_classification(path) == {True: 0, False: 3}
+    assert [total for _, total, _ in audit.counts_by_date(path)] == [3]
+
+
+def test_queries_do_not_create_a_database(tmp_path):
+    path = tmp_path / 'mistyped.sqlite3'
+    with pytest.raises(sqlite3.OperationalError):
+        audit.counts_by_classification(str(path))
+    assert not path.exists()
+
+
+def test_auditing_is_off_with_an_empty_path():
+    assert audit.open_from_environment({'APS_AUDIT_DB': ''}) is None
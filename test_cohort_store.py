@@ -0,0 +1,43 @@
+import pytest
+
+import cohort_store
+from aps_criteria import ENTRY_KEYS
+from cohort_store import CohortStore, build_store, count_rows, main
+from scoring import CRITERIA_KEYS
+
+HEADER = ','.join(ENTRY_KEYS + CRITERIA_KEYS) + '\n'
+ROW = ','.join(['1'] * len(ENTRY_KEYS) + ['0'] * len(CRITERIA_KEYS)) + '\n'
+
+
+def test_count_rows_skips_blank_lines(tmp_path):
+    cohort = tmp_path / 'cohort.csv'
+    cohort.write_text(HEADER + ROW + '\n' + ROW + '\r\n')
+    assert count_rows(str(cohort)) == 2
+    build_store(str(cohort), str(tmp_path / 'cohort.apsc'))
+    assert len(CohortStore(str(tmp_path / 'cohort.apsc'))) == 2
+
+
+@pytest.mark.parametrize('contents', ['', '\n'])
+def test_a_file_without_header_is_rejected(tmp_path, contents):
+    cohort = tmp_path / 'cohort.csv'
+    cohort.write_text(contents)
+    with pytest.raises(ValueError, match='no header'):
+        count_rows(str(cohort))
+
+
+def test_cli_reports_a_missing_input(tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main([str(tmp_path / 'missing.csv'), str(tmp_path / 'cohort.apsc')])
+    assert exit_info.value.code == 1
+    assert 'No such file' in capsys.readouterr().err
+
+
+def test_a_store_from_an_edited_criteria_set_is_rejected(tmp_path, monkeypatch):
+    cohort = tmp_path / 'cohort.csv'
+    cohort.write_text(HEADER + ROW)
+    build_store(str(cohort), str(tmp_path / 'cohort.apsc'))
+
+    # Same keys, different file contents (e.g. changed points or thresholds)
+    monkeypatch.setattr(cohort_store, 'criteria_set', cohort_store.criteria_set._replace(sha256='0' * 64))
+    with pytest.raises(ValueError, match='rebuild it'):
+        CohortStore(str(tmp_path / 'cohort.apsc'))
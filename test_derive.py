@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from aps_criteria import ENTRY_CLINICAL_KEYS, ENTRY_LAB_KEYS
+from derive import count_risk_factors, derive_criteria
+
+NAN = float('nan')
+D8 = ('mod_high_igm', 'mod_pos_igg', 'high_pos_igg_or', 'high_pos_igg_and')
+
+
+def derive_one(**raw):
+    """derive_criteria for a single patient, as {key: bool}"""
+    return {key: bool(flags[0]) for key, flags in derive_criteria({name: [value] for name, value in raw.items()}).items()}
+
+
+@pytest.mark.parametrize('acl_igg, acl_igm, ab2gpi_igg, ab2gpi_igm, checked', [
+    (NAN, NAN, NAN, NAN, set()),
+    (39.9, 39.9, 39.9, 39.9, set()),
+    (40, NAN, NAN, NAN, {'mod_pos_igg', 'entry_lab_1'}),
+    (79.9, NAN, NAN, NAN, {'mod_pos_igg', 'entry_lab_1'}),
+    (80, NAN, NAN, NAN, {'high_pos_igg_or', 'entry_lab_1'}),
+    (80, NAN, 80, NAN, {'high_pos_igg_or', 'high_pos_igg_and', 'entry_lab_1', 'entry_lab_2'}),
+    (80, NAN, 79, NAN, {'mod_pos_igg', 'high_pos_igg_or', 'entry_lab_1', 'entry_lab_2'}),
+    (NAN, 40, NAN, NAN, {'mod_high_igm', 'entry_lab_1'}),
+    (NAN, 200, NAN, NAN, {'mod_high_igm', 'entry_lab_1'}),  # IgM counts as moderate-high whatever the titre
+    (NAN, NAN, NAN, 40, {'mod_high_igm', 'entry_lab_2'}),
+])
+def test_titres(acl_igg, acl_igm, ab2gpi_igg, ab2gpi_igm, checked):
+    derived = derive_one(acl_igg=acl_igg, acl_igm=acl_igm, ab2gpi_igg=ab2gpi_igg, ab2gpi_igm=ab2gpi_igm)
+    assert {key for key in D8 + ENTRY_LAB_KEYS[1:] if derived[key]} == checked
+
+
+@pytest.mark.parametrize('first, last, checked', [
+    ('NaT', 'NaT', set()),
+    ('2024-01-01', '2024-01-01', {'single_lac', 'entry_lab_0'}),
+    ('2024-01-01', '2024-03-24', {'single_lac', 'entry_lab_0'}),  # 83 days
+    ('2024-01-01', '2024-03-25', {'persistent_lac', 'entry_lab_0'}),  # 84 days = 12 weeks
+    ('2024-01-01', 'NaT', {'single_lac', 'entry_lab_0'}),
+])
+def test_lac(first, last, checked):
+    derived = derive_one(lac_first_positive=np.datetime64(first), lac_last_positive=np.datetime64(last))
+    assert {key for key in ('single_lac', 'persistent_lac', ENTRY_LAB_KEYS[0]) if derived[key]} == checked
+
+
+@pytest.mark.parametrize('platelets, expected', [(19.9, False), (20, True), (130, True), (130.1, False), (NAN, False)])
+def test_thrombocytopenia(platelets, expected):
+    assert derive_one(platelet_nadir=platelets)['thrombocytopenia'] is expected
+
+
+@pytest.mark.parametrize('event, factors, high', [
+    (True, [], False),
+    (True, None, False),
+    (True, ['obesity'], False),
+    (True, ['obesity', 'hormone_therapy'], True),  # two minor
+    (True, ['major_trauma'], True),  # one major
+    (False, ['major_trauma'], None),
+])
+def test_vte_risk_profile(event, factors, high):
+    derived = derive_one(vte=event, vte_risk_factors=factors)
+    assert (derived['vte_high_risk'], derived['vte_low_risk']) == ((high, not high) if event else (False, False))
+
+
+@pytest.mark.parametrize('factors, high', [
+    (['tobacco_smoking', 'obesity'], False),
+    (['tobacco_smoking', 'obesity', 'treated_hypertension'], True),  # three moderate
+    (['chronic_kidney_disease'], True),  # one high
+])
+def test_cvd_risk_profile(factors, high):
+    derived = derive_one(ate=True, cvd_risk_factors=factors)
+    assert (derived['ate_high_risk'], derived['ate_low_risk']) == (high, not high)
+
+
+def test_missing_risk_factors():
+    high, = count_risk_factors([None, ['obesity'], None], ('obesity',))
+    assert high.tolist() == [0, 1, 0]
+    assert derive_one(vte=True)['vte_low_risk']
+    with pytest.raises(ValueError, match='typo'):
+        count_risk_factors([['typo']], ('obesity',))
+
+
+def test_entry_flags_are_backfilled_from_their_domain():
+    derived = derive_criteria({'livedo_racemosa': [True, False], 'platelet_nadir': [100, 200],
+                               ENTRY_CLINICAL_KEYS[0]: [False, True]})
+    assert derived[ENTRY_CLINICAL_KEYS[0]].tolist() == [False, True]  # given explicitly, kept
+    assert derived[ENTRY_CLINICAL_KEYS[2]].tolist() == [True, False]  # D3
+    assert derived[ENTRY_CLINICAL_KEYS[5]].tolist() == [True, False]  # D6
+    assert derived[ENTRY_CLINICAL_KEYS[1]].tolist() == [False, False]
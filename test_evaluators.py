@@ -0,0 +1,52 @@
+import csv
+
+import numpy as np
+
+from aps_criteria import ENTRY_KEYS
+from classify_cohort import classify_file
+from evaluators import combine_evaluators, load_evaluator, score_versions
+from scoring import CRITERIA_KEYS, encode_entry_matrix, meets_entry_masks, score_matrix
+
+
+def test_default_set_matches_scoring():
+    combined = combine_evaluators([load_evaluator('aps_2023')])
+    assert combined.keys == ENTRY_KEYS + CRITERIA_KEYS
+    matrix = np.random.default_rng(0).random((5_000, len(combined.keys))) < 0.2
+    scores = score_versions(matrix, combined)['aps_2023']
+
+    expected = score_matrix(matrix[:, len(ENTRY_KEYS):])
+    meets_entry = meets_entry_masks(encode_entry_matrix(matrix[:, :len(ENTRY_KEYS)]))
+    np.testing.assert_array_equal(scores.domains, expected.domains)
+    np.testing.assert_array_equal(scores.clinical, expected.clinical)
+    np.testing.assert_array_equal(scores.lab, expected.lab)
+    np.testing.assert_array_equal(scores.meets_entry, meets_entry)
+    np.testing.assert_array_equal(scores.classified, meets_entry & expected.classified)
+
+
+def test_sapporo_needs_one_clinical_and_one_laboratory_criterion():
+    combined = combine_evaluators([load_evaluator('sapporo_2006')])
+    patients = [{'vascular_thrombosis'}, {'persistent_lac', 'persistent_acl'},
+                {'3_consecutive_abortions', 'persistent_ab2gpi'}, set()]
+    matrix = [[key in patient for key in combined.keys] for patient in patients]
+    scores = score_versions(matrix, combined)['sapporo_2006']
+    assert scores.classified.tolist() == [False, False, True, False]
+    assert scores.meets_entry.all()  # no entry criteria
+
+
+def test_classify_several_versions(tmp_path):
+    combined = combine_evaluators([load_evaluator('aps_2023'), load_evaluator('sapporo_2006')])
+    matrix = np.random.default_rng(1).random((50, len(combined.keys))) < 0.3
+    cohort = tmp_path / 'cohort.csv'
+    cohort.write_text(','.join(combined.keys) + '\n' + ''.join(','.join(map(str, row)) + '\n'
+                                                                for row in matrix.astype(int).tolist()))
+    default, versions = tmp_path / 'default.csv', tmp_path / 'versions.csv'
+    assert classify_file(str(cohort), str(default)) == 50
+    assert classify_file(str(cohort), str(versions), chunk_size=16, criteria=['aps_2023', 'sapporo_2006']) == 50
+
+    with open(default) as f, open(versions) as g:
+        for expected, row in zip(csv.DictReader(f), csv.DictReader(g), strict=True):
+            assert expected == {name.removeprefix('aps_2023_'): value for name, value in row.items()
+                                if name.startswith('aps_2023_')}
+            assert set(row) - {f'aps_2023_{name}' for name in expected} == {
+                *(f'sapporo_2006_D{domain}' for domain in range(1, 6)), 'sapporo_2006_clinical', 'sapporo_2006_lab',
+                'sapporo_2006_meets_entry', 'sapporo_2006_classified'}
@@ -0,0 +1,25 @@
+import zipfile
+
+from aps_criteria import ENTRY_KEYS
+from export_reports import archive_name, export_reports
+from scoring import CRITERIA_KEYS
+
+
+def test_archive_names_stay_inside_the_archive_and_are_unique():
+    taken = set()
+    names = [archive_name(patient_id, taken) for patient_id in
+             ['../../etc/passwd', r'..\..\boot.ini', 'C:x', '.profile', '', 'mrn1', 'MRN1', 'mrn1', 'mrn1-2']]
+    assert names == ['____etc_passwd.txt', '____boot.ini.txt', 'C_x.txt', 'profile.txt', '_.txt', 'mrn1.txt',
+                     'MRN1-2.txt', 'mrn1-3.txt', 'mrn1-2-2.txt']
+
+
+def test_zip_export_keeps_every_patient(tmp_path):
+    ids = ['a/b', 'a\\b', '..', 'x', 'x']
+    cohort = tmp_path / 'cohort.csv'
+    cohort.write_text(','.join(('mrn',) + ENTRY_KEYS + CRITERIA_KEYS) + '\n' +
+                      ''.join(','.join([patient_id] + ['0'] * (len(ENTRY_KEYS) + len(CRITERIA_KEYS))) + '\n'
+                              for patient_id in ids))
+    output = tmp_path / 'reports.zip'
+    assert export_reports(str(cohort), str(output), chunk_size=2, id_column='mrn') == len(ids)
+    with zipfile.ZipFile(output) as archive:
+        assert archive.namelist() == ['a_b.txt', 'a_b-2.txt', '_.txt', 'x.txt', 'x-2.txt']
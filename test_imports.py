@@ -0,0 +1,15 @@
+"""
+The import check of benchmark.py's import suite: every core module imports in a fresh interpreter within the default
+budget and without loading anything beyond the standard library, NumPy and this repo's own modules.
+"""
+
+import pytest
+
+from benchmark import CORE_MODULES, IMPORT_BUDGET_S, THIRD_PARTY_ALLOWED, probe_import
+
+
+@pytest.mark.parametrize('module', CORE_MODULES)
+def test_core_module_import(module):
+    elapsed, loaded = probe_import(module)
+    assert not loaded - THIRD_PARTY_ALLOWED, f'{module} imports {", ".join(sorted(loaded - THIRD_PARTY_ALLOWED))}'
+    assert elapsed < IMPORT_BUDGET_S
@@ -0,0 +1,30 @@
+import pytest
+
+from instrumentation import METRICS, Metrics
+
+openmetrics = pytest.importorskip('prometheus_client.openmetrics.parser')
+
+
+def test_render_is_valid_openmetrics():
+    metrics = Metrics()
+    metrics.inc('aps_sessions')
+    metrics.inc('aps_reruns', page='vte')
+    metrics.inc('aps_reruns', 2, page='score')
+    metrics.observe('aps_page_render_seconds', 0.003, page='vte')
+    metrics.observe('aps_scoring_seconds', 20.0)
+
+    families = {family.name: family for family in openmetrics.text_string_to_metric_families(metrics.render())}
+    assert {name: family.type for name, family in families.items()} == {name: kind for name, (kind, _) in
+                                                                         METRICS.items()}
+    samples = {(sample.name, tuple(sorted(sample.labels.items()))): sample.value
+               for family in families.values() for sample in family.samples}
+    assert samples['aps_sessions_total', ()] == 1
+    assert samples['aps_reruns_total', (('page', 'score'),)] == 2
+    assert samples['aps_page_render_seconds_count', (('page', 'vte'),)] == 1
+    assert samples['aps_scoring_seconds_bucket', (('le', '10.0'),)] == 0
+    assert samples['aps_scoring_seconds_bucket', (('le', '+Inf'),)] == 1
+
+
+def test_empty_render_is_valid_openmetrics():
+    families = list(openmetrics.text_string_to_metric_families(Metrics().render()))
+    assert [family.name for family in families] == list(METRICS)
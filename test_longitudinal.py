@@ -0,0 +1,56 @@
+import datetime
+
+import pytest
+
+from longitudinal import Change, LongitudinalClassifier
+
+D = datetime.date
+
+
+@pytest.mark.parametrize('clinical, lab, expected', [
+    (D(2021, 1, 1), D(2024, 1, 1), True),
+    (D(2021, 1, 1), D(2024, 1, 2), False),  # one day past three calendar years, with no Feb 29 in between
+    (D(2024, 1, 2), D(2021, 1, 1), False),  # either order
+    (D(2020, 1, 1), D(2023, 1, 1), True),  # Feb 29 in between
+    (D(2024, 2, 29), D(2027, 2, 28), True),
+    (D(2024, 2, 29), D(2027, 3, 1), False),
+    (D(2024, 2, 29), D(2021, 2, 28), False),
+    (D(2024, 2, 29), D(2021, 3, 1), True),
+])
+def test_entry_window_is_three_calendar_years(clinical, lab, expected):
+    classifier = LongitudinalClassifier()
+    classifier.add_event('p', clinical, 'vte_low_risk')
+    classifier.add_event('p', lab, 'persistent_lac')
+    assert classifier.status('p').meets_entry is expected
+
+
+def test_retracting_the_only_pair_unmeets_entry():
+    classifier = LongitudinalClassifier()
+    classifier.add_event('p', D(2021, 1, 1), 'vte_low_risk')
+    classifier.add_event('p', D(2024, 1, 1), 'persistent_lac')
+    classifier.add_event('p', D(2024, 1, 2), 'persistent_lac')
+    classifier.retract_event('p', D(2024, 1, 1), 'persistent_lac')
+    assert not classifier.status('p').meets_entry
+
+
+PAIR = [('p', D(2021, 1, 1), 'vte_low_risk'), ('p', D(2021, 2, 1), 'persistent_lac')]  # classified together
+
+
+def test_a_bad_key_adds_nothing_from_the_batch():
+    classifier = LongitudinalClassifier()
+    with pytest.raises(KeyError):
+        classifier.add_events(PAIR + [('p', D(2021, 3, 1), 'typo')])
+    assert 'p' not in classifier.patients
+    assert classifier.changes_since(0) == []
+
+    assert classifier.add_events(PAIR, recorded_at=1) == ['p']
+    assert classifier.status('p').classified and classifier.classified == {'p': True}
+    assert classifier.changes_since(0) == [Change(1, 'p', True)]
+
+
+def test_a_failing_event_still_records_the_flips_before_it():
+    classifier = LongitudinalClassifier()
+    with pytest.raises(TypeError):
+        classifier.add_events(PAIR + [('p', '2021-03-01', 'vte_low_risk')], recorded_at=1)  # not a date
+    assert classifier.classified == {'p': True}
+    assert classifier.changes_since(0) == [Change(1, 'p', True)]
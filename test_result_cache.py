@@ -0,0 +1,44 @@
+import numpy as np
+
+from result_cache import ResultCache, cache_key, compute_results
+
+
+def keys_of(cache: ResultCache):
+    return list(cache._entries)
+
+
+def test_get_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    first = cache.get(1, 0b1)
+    cache.get(1, 0b10)
+    assert cache.get(1, 0b1) is first  # hit, now most recent
+    cache.get(1, 0b100)  # evicts 0b10
+    assert keys_of(cache) == [cache_key(1, 0b1), cache_key(1, 0b100)]
+    assert cache.stats() == {'hits': 1, 'misses': 3, 'evictions': 1, 'hit_rate': 0.25, 'size': 2, 'max_entries': 2}
+
+
+def test_get_many_counts_each_unique_answer_set_once():
+    cache = ResultCache(max_entries=10)
+    cache.get(0, 5)
+    results = cache.get_many([0, 0, 0, 1], [5, 6, 6, 6])
+    assert results == compute_results(np.array([5, 6, 6, cache_key(1, 6)], dtype=np.uint64))
+    assert results[1] is results[2]
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 3
+
+
+def test_oversized_batch_keeps_its_last_entries():
+    cache = ResultCache(max_entries=3)
+    cache.get(0, 100)
+    results = cache.get_many(np.zeros(5, dtype=np.uint64), [5, 1, 4, 2, 3])
+    assert len(results) == 5
+    # Misses are computed in sorted key order, and only the last max_entries of them are kept
+    assert keys_of(cache) == [3, 4, 5]
+    assert cache.stats()['evictions'] == 1 and cache.stats()['size'] == 3
+
+
+def test_results_match_compute_results():
+    entries, answers = [0b1000001, 0, 0b1000001], [0b11, 1 << 20, (1 << 26) - 1]
+    keys = np.array([cache_key(entry, mask) for entry, mask in zip(entries, answers)], dtype=np.uint64)
+    expected = compute_results(keys)
+    assert ResultCache().get_many(entries, answers) == expected
+    assert [ResultCache().get(entry, mask) for entry, mask in zip(entries, answers)] == expected
@@ -0,0 +1,94 @@
+"""
+Consistency tests of the scoring paths: score_masks (lookup tables, used by the web app through assess and by the
+cache, service, export and cohort store), score_matrix (reduceat, used by classify_cohort) and the criteria
+definitions themselves.
+
+Domains are scored independently and classification only depends on the (clinical, lab) totals, so checking every
+subset of every domain plus every pair of totals covers every answer combination. The sweep over all
+2**len(CRITERIA_KEYS) bitmasks is opt-in: python -m pytest --exhaustive
+"""
+
+import numpy as np
+import pytest
+
+from aps_criteria import ENTRY_CLINICAL_KEYS, ENTRY_KEYS, criteria, criteria_set, encode_answers, registry
+from scoring import (BIT_WEIGHTS, CLASSIFICATION_TABLE, CLINICAL_DOMAINS, CLINICAL_THRESHOLD, CRITERIA_KEYS, DOMAINS,
+                     LAB_DOMAINS, LAB_THRESHOLD, Scores, assess, encode_matrix, format_reports, meets_entry_masks,
+                     score_masks, score_matrix)
+
+
+def reference_domains(mask: int):
+    """Highest points of the checked criteria in each domain, straight from the criteria definitions"""
+    checked = [criterion for key, criterion in criteria.items() if mask >> registry.bit_position[key] & 1]
+    return [max((c.points for c in checked if c.domain == domain), default=0) for domain in DOMAINS]
+
+
+def masks_to_matrix(masks):
+    return (np.asarray(masks, dtype=np.uint64).reshape(-1, 1) & BIT_WEIGHTS) != 0
+
+
+def assert_scores_equal(expected: Scores, actual: Scores):
+    for field in Scores._fields:
+        np.testing.assert_array_equal(getattr(actual, field), getattr(expected, field), err_msg=field)
+
+
+@pytest.mark.parametrize('domain', DOMAINS)
+def test_every_domain_subset(domain):
+    masks = [subset << registry.domain_shift[domain] for subset in range(1 << registry.domain_width[domain])]
+    by_masks = score_masks(masks)
+    assert_scores_equal(score_matrix(masks_to_matrix(masks)), by_masks)
+
+    for mask, domains in zip(masks, by_masks.domains.tolist()):
+        assert domains == reference_domains(mask), f'D{domain} subset {mask >> registry.domain_shift[domain]:b}'
+        assessment = assess(mask, True)
+        assert list(assessment.scores.values()) == domains
+        assert assessment.clinical == sum(assessment.scores[d] for d in CLINICAL_DOMAINS)
+        assert assessment.lab == sum(assessment.scores[d] for d in LAB_DOMAINS)
+
+
+def test_every_pair_of_totals():
+    clinical, lab = np.indices(CLASSIFICATION_TABLE.shape)
+    np.testing.assert_array_equal(CLASSIFICATION_TABLE, (clinical >= CLINICAL_THRESHOLD) & (lab >= LAB_THRESHOLD))
+    assert CLASSIFICATION_TABLE.shape == (sum(max(registry.domain_points[d]) for d in CLINICAL_DOMAINS) + 1,
+                                          sum(max(registry.domain_points[d]) for d in LAB_DOMAINS) + 1)
+
+
+def test_random_patients():
+    matrix = np.random.default_rng(0).random((10_000, len(CRITERIA_KEYS))) < 0.2
+    masks = encode_matrix(matrix)
+    assert_scores_equal(score_matrix(matrix), score_masks(masks))
+
+    for row, mask in zip(matrix[:500], masks[:500].tolist()):
+        assert mask == encode_answers(dict(zip(CRITERIA_KEYS, row.tolist())))
+        assessment = assess(mask, True)
+        domains = reference_domains(mask)
+        clinical, lab = sum(domains[:len(CLINICAL_DOMAINS)]), sum(domains[len(CLINICAL_DOMAINS):])
+        assert assessment.classified == (clinical >= CLINICAL_THRESHOLD and lab >= LAB_THRESHOLD)
+        assert not assess(mask, False).classified
+
+
+def test_entry_criteria():
+    masks = np.arange(1 << len(ENTRY_KEYS))
+    flags = (masks.reshape(-1, 1) >> np.arange(len(ENTRY_KEYS))) & 1 != 0
+    n_clinical = len(ENTRY_CLINICAL_KEYS)
+    expected = flags[:, :n_clinical].any(axis=1) & flags[:, n_clinical:].any(axis=1)
+    np.testing.assert_array_equal(meets_entry_masks(masks), expected)
+
+
+def test_report_lines():
+    scores = score_masks([encode_answers({'vte_low_risk': True, 'persistent_lac': True})])
+    report, = format_reports(scores.domains, scores.clinical, scores.lab)
+    values = dict(line.strip().rsplit(maxsplit=1) for line in report.splitlines()
+                  if line.strip().startswith(('D', 'T')))
+    assert values.pop('Domain') == 'Score'
+    assert values == {**{f'D{domain}: {criteria_set.domain_names[domain]}': str(points)
+                         for domain, points in zip(DOMAINS, scores.domains[0].tolist())},
+                      'Total Clinical': str(scores.clinical[0]), 'Total Lab': str(scores.lab[0])}
+
+
+@pytest.mark.exhaustive
+def test_every_answer_combination():
+    chunk_size = 1 << 20
+    for start in range(0, 1 << len(CRITERIA_KEYS), chunk_size):
+        masks = np.arange(start, min(start + chunk_size, 1 << len(CRITERIA_KEYS)), dtype=np.uint64)
+        assert_scores_equal(score_matrix(masks_to_matrix(masks)), score_masks(masks))
@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+import pytest
+
+from service import MAX_LINE_BYTES, handle_connection
+
+
+def exchange(request: bytes):
+    """Sends raw bytes to a service on an ephemeral port; returns the status code and the JSON body of the response"""
+    async def run():
+        server = await asyncio.start_server(handle_connection, '127.0.0.1', 0, limit=MAX_LINE_BYTES)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname())
+            writer.write(request)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), timeout=10)
+            writer.close()
+        return response
+
+    head, _, body = asyncio.run(run()).partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+def post(body: bytes, content_length):
+    return (f'POST /score HTTP/1.1\r\nContent-Length: {content_length}\r\nConnection: close\r\n\r\n').encode() + body
+
+
+def test_score():
+    status, result = exchange(post(b'{"entry_clinical_0": true}', 26))
+    assert status == 200 and result['meets_entry'] is False
+
+
+@pytest.mark.parametrize('request_bytes, expected', [
+    (post(b'{}', -5), 400),
+    (post(b'{}', 'two'), 400),
+    (post(b'', 10 ** 12), 413),
+    (b'GET /' + b'x' * MAX_LINE_BYTES + b' HTTP/1.1\r\n\r\n', 414),
+    (b'GET /health HTTP/1.1\r\nX-Long: ' + b'x' * MAX_LINE_BYTES + b'\r\n\r\n', 431),
+    (b'GARBAGE\r\n\r\n', 400),
+])
+def test_malformed_heads_get_an_error_response(request_bytes, expected):
+    status, result = exchange(request_bytes)
+    assert status == expected and 'error' in result